@@ -0,0 +1,178 @@
+import threading
+import numpy as np
+import pandas as pd
+
+from snapshot import get_snapshot, REFERENCIAS_SUPERHERO
+from database import execute_dataframe_query
+from metricas import medido
+
+# Conteos agrupados por varias dimensiones de superhero en una sola pasada.
+# En lugar de un GROUP BY (o una consulta) por cada combinación de columnas, se
+# cuenta una vez cada combinación de todas las columnas pedidas (el "cubo") y de ahí
+# se sacan los conteos de cualquier subconjunto sumando filas, sin volver a leer superhero.
+# El cubo puede salir de los códigos enteros del snapshot o de un único GROUP BY en SQL.
+
+class CuboConteos:
+    """Cantidad de filas por cada combinación de valores de varias columnas de códigos"""
+
+    def __init__(self, columnas, codigos, conteos):
+        self.columnas = list(columnas)
+        self.codigos = codigos
+        self.conteos = conteos
+
+    @staticmethod
+    def _combinar(codigos):
+        """Agrupa filas iguales de una matriz de códigos: devuelve (combinaciones, índice de cada fila)"""
+        if codigos.shape[1] == 0:
+            return codigos[:1], np.zeros(len(codigos), dtype=np.int64)
+        # Los códigos van de -1 (NULL) en adelante: se desplazan para poder empaquetarlos
+        desplazados = codigos.astype(np.int64) + 1
+        dimensiones = tuple(int(d) for d in desplazados.max(axis=0) + 1)
+        if np.prod(dimensiones, dtype=float) < 2 ** 62:
+            # Cada combinación se empaqueta en un único entero (mucho más rápido que unique por filas)
+            claves = np.ravel_multi_index(tuple(desplazados.T), dimensiones)
+            unicas, inversa = np.unique(claves, return_inverse=True)
+            combinaciones = np.stack(np.unravel_index(unicas, dimensiones), axis=1) - 1
+        else:
+            combinaciones, inversa = np.unique(codigos, axis=0, return_inverse=True)
+        return combinaciones.astype(codigos.dtype), inversa.ravel()
+
+    @classmethod
+    def desde_codigos(cls, codigos_por_columna):
+        """Construye el cubo recorriendo una sola vez las columnas de códigos (una por dimensión)"""
+        columnas = list(codigos_por_columna)
+        codigos = np.stack([np.asarray(codigos_por_columna[c]) for c in columnas], axis=1)
+        combinaciones, inversa = cls._combinar(codigos)
+        conteos = np.bincount(inversa, minlength=len(combinaciones)).astype(np.int64)
+        return cls(columnas, combinaciones, conteos)
+
+    def marginal(self, columnas):
+        """Conteos por un subconjunto de las columnas, sumando sobre el resto (sin releer las filas)"""
+        posiciones = [self.columnas.index(c) for c in columnas]
+        combinaciones, inversa = self._combinar(self.codigos[:, posiciones])
+        conteos = np.bincount(inversa, weights=self.conteos, minlength=len(combinaciones)).astype(np.int64)
+        return combinaciones, conteos
+
+    def memoria(self):
+        """Memoria ocupada en bytes"""
+        return int(self.codigos.nbytes + self.conteos.nbytes)
+
+def _marginal_por_nombre(cubo, columnas, referencias):
+    """
+    Marginal traducido de posiciones a nombres y vuelto a agrupar por nombre,
+    igual que un JOIN con cada tabla de referencia + GROUP BY por el nombre.
+    Las combinaciones con alguna referencia NULL o inexistente se descartan (como en el JOIN).
+    Devuelve (códigos de nombre por columna, conteos); los códigos siguen el orden alfabético.
+    """
+    combinaciones, conteos = cubo.marginal(columnas)
+    validas = (combinaciones >= 0).all(axis=1)
+    codigos = np.stack([referencia.nombres.codes[combinaciones[validas, i]]
+                        for i, referencia in enumerate(referencias)], axis=1)
+    agrupadas, inversa = CuboConteos._combinar(codigos)
+    return agrupadas, np.bincount(inversa, weights=conteos[validas], minlength=len(agrupadas)).astype(np.int64)
+
+def _nombres(referencia, codigos):
+    """Nombres a partir de códigos de la categoría (None para los nombres NULL)"""
+    categorias = np.asarray(referencia.nombres.categories, dtype=object)
+    return np.where(codigos >= 0, categorias[np.maximum(codigos, 0)], None)
+
+# ----- ORÍGENES DEL CUBO -----
+
+_cubos = {}
+_lock_cubos = threading.Lock()
+
+def cubo_snapshot(columnas):
+    """Cubo de columnas de superhero calculado sobre los códigos del snapshot (se guarda por versión)"""
+    snapshot = get_snapshot()
+    clave = (snapshot.version, tuple(columnas))
+    cubo = _cubos.get(clave)
+    if cubo is None:
+        cubo = CuboConteos.desde_codigos({c: snapshot.codigos_heroes[c] for c in columnas})
+        with _lock_cubos:
+            # Los cubos de versiones anteriores ya no se usan
+            for vieja in [k for k in _cubos if k[0] != snapshot.version]:
+                del _cubos[vieja]
+            _cubos[clave] = cubo
+    return cubo
+
+def cubo_sql(columnas):
+    """
+    Cubo de columnas de superhero leído con un único GROUP BY (un solo recorrido de la tabla).
+    Los ids se traducen a posiciones del snapshot para poder usar las mismas tablas de referencia.
+    """
+    lista = ", ".join(columnas)
+    df = execute_dataframe_query(f"SELECT {lista}, COUNT(*) AS conteo FROM superhero GROUP BY {lista}")
+    snapshot = get_snapshot()
+    codigos = np.stack([
+        snapshot.referencias[REFERENCIAS_SUPERHERO[c]].codificar(
+            pd.to_numeric(df[c]).fillna(-1).to_numpy(dtype=np.int64))
+        for c in columnas
+    ], axis=1) if len(columnas) else np.zeros((len(df), 0), dtype=np.int32)
+    # Dos ids distintos pueden caer en la misma posición (-1): se vuelven a agrupar
+    combinaciones, inversa = CuboConteos._combinar(codigos)
+    conteos = np.bincount(inversa, weights=df["conteo"].to_numpy(), minlength=len(combinaciones)).astype(np.int64)
+    return CuboConteos(columnas, combinaciones, conteos)
+
+def get_cubo(columnas, origen="snapshot"):
+    """Cubo de conteos desde el snapshot en memoria o desde un GROUP BY en la base de datos"""
+    if origen == "snapshot":
+        return cubo_snapshot(columnas)
+    if origen == "sql":
+        return cubo_sql(columnas)
+    raise ValueError(f"Origen desconocido: {origen}")
+
+# ----- CARACTERÍSTICAS FÍSICAS -----
+
+# Columna de superhero -> nombre de la característica
+CARACTERISTICAS = {
+    "eye_colour_id": "Color de ojos",
+    "hair_colour_id": "Color de cabello",
+    "skin_colour_id": "Color de piel",
+}
+
+@medido("dataframe")
+def get_caracteristicas_por_alineacion(origen="snapshot"):
+    """
+    Distribución de colores de ojos, cabello y piel por alineación, en un solo recorrido
+    de superhero. Ordenada por alineación, característica y cantidad descendente.
+    """
+    columnas = ["alignment_id"] + list(CARACTERISTICAS)
+    cubo = get_cubo(columnas, origen)
+    referencias = get_snapshot().referencias
+    alineaciones, colores, caracteristicas, cantidades = [], [], [], []
+    for orden, columna in enumerate(sorted(CARACTERISTICAS, key=CARACTERISTICAS.get)):
+        codigos, conteos = _marginal_por_nombre(cubo, ["alignment_id", columna],
+                                                [referencias["alignment"], referencias["colour"]])
+        alineaciones.append(codigos[:, 0])
+        colores.append(codigos[:, 1])
+        caracteristicas.append(np.full(len(conteos), orden))
+        cantidades.append(conteos)
+    alineaciones, colores, caracteristicas, cantidades = (
+        np.concatenate(v) for v in (alineaciones, colores, caracteristicas, cantidades))
+
+    # Los códigos de nombre siguen el orden alfabético, así que se ordena sin comparar textos
+    orden = np.lexsort((colores, -cantidades, caracteristicas, alineaciones))
+    nombres_caracteristicas = np.array(sorted(CARACTERISTICAS.values()), dtype=object)
+    return pd.DataFrame({
+        'Alineación': _nombres(referencias["alignment"], alineaciones[orden]),
+        'Característica': nombres_caracteristicas[caracteristicas[orden]],
+        'Color': _nombres(referencias["colour"], colores[orden]),
+        'Cantidad': cantidades[orden],
+    })
+
+def get_top_colores(TOP=10, origen="snapshot"):
+    """
+    Los TOP colores de ojos, cabello y piel, calculados juntos en un solo recorrido.
+    Devuelve un diccionario columna -> DataFrame (Color, Cantidad) ordenado de mayor a menor.
+    """
+    cubo = get_cubo(list(CARACTERISTICAS), origen)
+    colores = get_snapshot().referencias["colour"]
+    resultado = {}
+    for columna in CARACTERISTICAS:
+        codigos, conteos = _marginal_por_nombre(cubo, [columna], [colores])
+        elegidos = np.argsort(-conteos, kind="stable")[:TOP]
+        resultado[columna] = pd.DataFrame({
+            'Color': _nombres(colores, codigos[elegidos, 0]),
+            'Cantidad': conteos[elegidos],
+        })
+    return resultado
@@ -0,0 +1,83 @@
+"""
+Compara las formas de calcular los conteos de colores (ojos, cabello y piel) por alineación.
+
+- tres_consultas: una consulta por característica (como hacía el gráfico de características)
+- union_all: la consulta original de /sql/caracteristicas-por-alineacion (tres GROUP BY unidos)
+- cubo_sql: un único GROUP BY por las cuatro columnas, marginalizado en memoria (agregados.py)
+- cubo_snapshot: el mismo cubo sobre los códigos del snapshot, sin ir a la base de datos
+
+Para cada variante muestra el tiempo medio y cuántas veces se recorrió superhero
+(apariciones de la tabla en las sentencias ejecutadas).
+
+Uso:
+    DATABASE_URL=sqlite:////ruta/superheroes.db python benchmarks/bench_agregados.py --repeticiones 50
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+# Sin caché de consultas: cada repetición debe llegar a la base de datos
+os.environ["QUERY_CACHE_TTL"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+import agregados
+from database import get_engine, execute_dataframe_query
+from snapshot import get_snapshot
+
+CONSULTA_CARACTERISTICA = """
+SELECT a.alignment, c.colour, COUNT(s.id) AS cantidad
+FROM alignment a
+JOIN superhero s ON a.id = s.alignment_id
+JOIN colour c ON s.{columna} = c.id
+GROUP BY a.alignment, c.colour
+"""
+
+UNION_ALL = " UNION ALL ".join(
+    f"SELECT a.alignment, '{nombre}' AS caracteristica, c.colour, COUNT(s.id) AS cantidad "
+    f"FROM alignment a JOIN superhero s ON a.id = s.alignment_id JOIN colour c ON s.{columna} = c.id "
+    f"GROUP BY a.alignment, c.colour"
+    for columna, nombre in agregados.CARACTERISTICAS.items()
+) + " ORDER BY 1, 2, 4 DESC"
+
+def tres_consultas():
+    return [execute_dataframe_query(CONSULTA_CARACTERISTICA.format(columna=c)) for c in agregados.CARACTERISTICAS]
+
+def union_all():
+    return execute_dataframe_query(UNION_ALL)
+
+def cubo_sql():
+    return agregados.get_caracteristicas_por_alineacion("sql")
+
+def cubo_snapshot():
+    # Se vacía la caché de cubos para medir también su construcción
+    agregados._cubos.clear()
+    return agregados.get_caracteristicas_por_alineacion("snapshot")
+
+VARIANTES = [tres_consultas, union_all, cubo_sql, cubo_snapshot]
+
+_RECORRIDOS = re.compile(r"\bsuperhero\b", re.IGNORECASE)
+recorridos = [0]
+
+def _contar(conn, cursor, statement, parameters, context, executemany):
+    recorridos[0] += len(_RECORRIDOS.findall(statement))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+
+    get_snapshot()
+    event.listen(get_engine(), "before_cursor_execute", _contar)
+    print(f"{'variante':<16} {'ms/llamada':>11} {'recorridos de superhero':>24}")
+    for variante in VARIANTES:
+        variante()
+        recorridos[0] = 0
+        inicio = time.perf_counter()
+        for _ in range(args.repeticiones):
+            variante()
+        ms = (time.perf_counter() - inicio) * 1000 / args.repeticiones
+        print(f"{variante.__name__:<16} {ms:>11.3f} {recorridos[0] / args.repeticiones:>24.0f}")
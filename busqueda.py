@@ -0,0 +1,262 @@
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+import numpy as np
+
+from snapshot import get_snapshot, snapshot_actual
+
+# Índice de trigramas en memoria para buscar nombres de héroes, poderes y editoriales.
+# Los endpoints filtraban con LIKE '%texto%', que obliga a recorrer la tabla entera en
+# cada petición. Aquí cada nombre se parte en trigramas ("  ab", " ab", "abc", ...) y
+# se guarda, por trigrama, la lista de nombres que lo contienen. Una búsqueda por
+# subcadena intersecta las listas de los trigramas de la consulta; una por prefijo usa
+# la lista ordenada de nombres; una difusa cuenta trigramas compartidos (como pg_trgm).
+# El resultado son ids, con los que después se consulta la base de datos.
+
+# Campos indexados (superhero_name y full_name de superhero, power_name y publisher_name)
+CAMPOS_BUSQUEDA = ("superhero_name", "full_name", "power_name", "publisher_name")
+
+# Modos de búsqueda aceptados por buscar()
+MODOS_BUSQUEDA = ("auto", "contiene", "prefijo", "difuso")
+
+# Similitud mínima (trigramas compartidos / trigramas totales) para la búsqueda difusa
+UMBRAL_DIFUSO = 0.3
+
+# Orden de los tipos de coincidencia en los resultados
+_RANGO_COINCIDENCIA = {"exacto": 0, "prefijo": 1, "contiene": 2, "difuso": 3}
+
+def normalizar(texto):
+    """Minúsculas, sin acentos y con los espacios colapsados (como la colación _ai_ci de MySQL)"""
+    if texto is None or (isinstance(texto, float) and np.isnan(texto)):
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", str(texto))
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_acentos.lower().split())
+
+def trigramas(texto, relleno=True):
+    """Trigramas de un texto ya normalizado; con relleno se marcan el inicio y el final"""
+    if relleno:
+        texto = f"  {texto} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+class IndiceTrigramas:
+    """
+    Índice de un campo: nombres distintos (normalizados y ordenados), los ids que
+    tiene cada nombre y, por cada trigrama, las posiciones de los nombres que lo contienen.
+    """
+
+    def __init__(self, ids, textos):
+        por_texto = {}
+        for id_, original in zip(np.asarray(ids, dtype=np.int64).tolist(), np.asarray(textos, dtype=object)):
+            if original is None or original != original:  # NULL (None o NaN)
+                continue
+            normalizado = normalizar(original)
+            entrada = por_texto.setdefault(normalizado, [original, []])
+            entrada[1].append(id_)
+
+        self.textos = sorted(por_texto)
+        self.originales = [por_texto[t][0] for t in self.textos]
+        self.ids = [sorted(por_texto[t][1]) for t in self.textos]
+
+        listas = {}
+        self._n_trigramas = np.zeros(len(self.textos), dtype=np.int32)
+        for posicion, texto in enumerate(self.textos):
+            propios = trigramas(texto)
+            self._n_trigramas[posicion] = len(propios)
+            for trigrama in propios:
+                listas.setdefault(trigrama, []).append(posicion)
+        # Las posiciones se agregan en orden, así que cada lista ya está ordenada
+        self._listas = {t: np.array(p, dtype=np.int32) for t, p in listas.items()}
+
+    def __len__(self):
+        return len(self.textos)
+
+    def exacto(self, consulta):
+        """Posición del nombre igual a la consulta (tras normalizar), o None"""
+        q = normalizar(consulta)
+        posicion = bisect_left(self.textos, q)
+        if posicion < len(self.textos) and self.textos[posicion] == q:
+            return posicion
+        return None
+
+    def prefijo(self, consulta):
+        """Posiciones de los nombres que empiezan por la consulta"""
+        q = normalizar(consulta)
+        inicio = bisect_left(self.textos, q)
+        fin = bisect_left(self.textos, q + "\uffff")
+        return np.arange(inicio, fin, dtype=np.int32)
+
+    def contiene(self, consulta):
+        """Posiciones de los nombres que contienen la consulta (lo que hacía LIKE '%texto%')"""
+        q = normalizar(consulta)
+        if len(q) < 3:
+            # Con menos de tres letras no hay trigramas: se recorre la lista (son pocos nombres)
+            return np.array([i for i, t in enumerate(self.textos) if q in t], dtype=np.int32)
+        listas = []
+        for trigrama in trigramas(q, relleno=False):
+            lista = self._listas.get(trigrama)
+            if lista is None:
+                return np.zeros(0, dtype=np.int32)
+            listas.append(lista)
+        listas.sort(key=len)
+        candidatos = listas[0]
+        for lista in listas[1:]:
+            candidatos = np.intersect1d(candidatos, lista, assume_unique=True)
+            if len(candidatos) == 0:
+                break
+        # Tener todos los trigramas no garantiza el orden: se verifica la subcadena
+        return np.array([i for i in candidatos.tolist() if q in self.textos[i]], dtype=np.int32)
+
+    def difuso(self, consulta, umbral=UMBRAL_DIFUSO):
+        """Posiciones y similitud de los nombres con suficientes trigramas en común"""
+        propios = trigramas(normalizar(consulta))
+        listas = [self._listas[t] for t in propios if t in self._listas]
+        if not listas:
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
+        comunes = np.bincount(np.concatenate(listas), minlength=len(self.textos))
+        similitud = comunes / (len(propios) + self._n_trigramas - comunes)
+        posiciones = np.flatnonzero(similitud >= umbral).astype(np.int32)
+        return posiciones, similitud[posiciones]
+
+    def similitud(self, consulta, posicion):
+        """Similitud de trigramas entre la consulta y un nombre (0-1)"""
+        propios, ajenos = trigramas(normalizar(consulta)), trigramas(self.textos[posicion])
+        union = len(propios | ajenos)
+        return len(propios & ajenos) / union if union else 0.0
+
+    def ids_de(self, posiciones):
+        """Ids de todas las filas cuyos nombres están en esas posiciones, ordenados"""
+        return sorted(id_ for p in np.asarray(posiciones).tolist() for id_ in self.ids[p])
+
+    def buscar(self, consulta, limite=10, modo="auto"):
+        """
+        Coincidencias de la consulta como lista de (posición, tipo de coincidencia, similitud).
+        Primero las exactas, por prefijo y por subcadena (las más cortas antes) y después
+        las difusas, de mayor a menor similitud.
+        """
+        if modo not in MODOS_BUSQUEDA:
+            raise ValueError(f"Modo desconocido: {modo}. Usa uno de {', '.join(MODOS_BUSQUEDA)}")
+        q = normalizar(consulta)
+        literales = []
+        if modo in ("auto", "contiene", "prefijo"):
+            posiciones = self.prefijo(q) if modo == "prefijo" else self.contiene(q)
+            for posicion in posiciones.tolist():
+                texto = self.textos[posicion]
+                tipo = "exacto" if texto == q else "prefijo" if texto.startswith(q) else "contiene"
+                literales.append((_RANGO_COINCIDENCIA[tipo], len(texto), texto, posicion, tipo))
+            literales = sorted(literales)[:limite]
+        resultados = [(posicion, tipo, self.similitud(q, posicion)) for *_, posicion, tipo in literales]
+
+        if modo == "difuso" or (modo == "auto" and len(resultados) < limite):
+            vistas = {posicion for posicion, _, _ in resultados}
+            posiciones, similitudes = self.difuso(q)
+            for i in np.lexsort((posiciones, -similitudes)).tolist():
+                if len(resultados) >= limite:
+                    break
+                if int(posiciones[i]) not in vistas:
+                    resultados.append((int(posiciones[i]), "difuso", float(similitudes[i])))
+        return resultados
+
+    def memoria(self):
+        """Memoria aproximada de las listas de trigramas, en bytes"""
+        return int(sum(lista.nbytes for lista in self._listas.values()) + self._n_trigramas.nbytes)
+
+class IndiceBusqueda:
+    """Un índice de trigramas por campo, construido a partir del snapshot"""
+
+    def __init__(self, snapshot):
+        self.version = snapshot.version
+        inicio = time.perf_counter()
+        heroes, referencias = snapshot.heroes, snapshot.referencias
+        nombres_completos = snapshot.nombres_completos
+        if nombres_completos is None:
+            nombres_completos = [None] * len(heroes)
+        self.campos = {
+            "superhero_name": IndiceTrigramas(heroes.ids, heroes.nombres),
+            "full_name": IndiceTrigramas(heroes.ids, nombres_completos),
+            "power_name": IndiceTrigramas(referencias["superpower"].ids, referencias["superpower"].nombres),
+            "publisher_name": IndiceTrigramas(referencias["publisher"].ids, referencias["publisher"].nombres),
+        }
+        self.segundos_construccion = round(time.perf_counter() - inicio, 4)
+
+    def buscar(self, consulta, campos=None, limite=10, modo="auto"):
+        """Mejores coincidencias en uno o varios campos, mezcladas y ordenadas"""
+        campos = list(campos or CAMPOS_BUSQUEDA)
+        desconocidos = [c for c in campos if c not in self.campos]
+        if desconocidos:
+            raise ValueError(f"Campos desconocidos: {', '.join(desconocidos)}. Usa {', '.join(CAMPOS_BUSQUEDA)}")
+        resultados = []
+        for campo in campos:
+            indice = self.campos[campo]
+            for posicion, tipo, similitud in indice.buscar(consulta, limite, modo):
+                resultados.append({
+                    "campo": campo,
+                    "texto": indice.originales[posicion],
+                    "ids": indice.ids[posicion],
+                    "coincidencia": tipo,
+                    "similitud": round(similitud, 3),
+                })
+        resultados.sort(key=lambda r: (_RANGO_COINCIDENCIA[r["coincidencia"]],
+                                       -r["similitud"] if r["coincidencia"] == "difuso" else len(r["texto"])))
+        return resultados[:limite]
+
+    def info(self):
+        """Versión del snapshot, nombres y trigramas por campo, y tiempo de construcción"""
+        return {
+            "version_snapshot": self.version,
+            "segundos_construccion": self.segundos_construccion,
+            "campos": {campo: {"nombres": len(indice), "trigramas": len(indice._listas),
+                               "memoria_bytes": indice.memoria()}
+                       for campo, indice in self.campos.items()},
+        }
+
+_indice = None
+_lock_indice = threading.Lock()
+
+def get_indice():
+    """Devuelve el índice de la versión actual del snapshot, reconstruyéndolo si los datos cambiaron"""
+    snapshot = get_snapshot()
+    indice = _indice
+    if indice is None or indice.version != snapshot.version:
+        with _lock_indice:
+            indice = _actualizar(snapshot)
+    return indice
+
+def indice_vigente():
+    """Indica si el índice ya está construido para el snapshot actual (usarlo no toca la base de datos)"""
+    snapshot, indice = snapshot_actual(), _indice
+    return snapshot is not None and indice is not None and indice.version == snapshot.version
+
+def _actualizar(snapshot):
+    global _indice
+    if _indice is None or _indice.version != snapshot.version:
+        _indice = IndiceBusqueda(snapshot)
+    return _indice
+
+def buscar(consulta, campos=None, limite=10, modo="auto"):
+    """Búsqueda para autocompletar: coincidencias exactas, por prefijo, por subcadena y difusas"""
+    return get_indice().buscar(consulta, campos, limite, modo)
+
+def ids_heroes(nombre):
+    """Ids de los superhéroes con ese nombre exacto (sin distinguir mayúsculas ni acentos)"""
+    indice = get_indice().campos["superhero_name"]
+    posicion = indice.exacto(nombre)
+    return [] if posicion is None else list(indice.ids[posicion])
+
+def ids_poderes(termino):
+    """Ids de los poderes cuyo nombre contiene el término"""
+    indice = get_indice().campos["power_name"]
+    return indice.ids_de(indice.contiene(termino))
+
+def ids_editoriales(termino):
+    """Ids de las editoriales cuyo nombre contiene el término"""
+    indice = get_indice().campos["publisher_name"]
+    return indice.ids_de(indice.contiene(termino))
+
+def info_busqueda():
+    """Estado del índice sin forzar su construcción"""
+    indice = _indice
+    if indice is None:
+        return {"construido": False}
+    return {"construido": True, **indice.info()}
@@ -0,0 +1,324 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from entorno import env_int
+
+# Caché de resultados de consultas. Los dashboards repiten las mismas URLs con los
+# mismos parámetros miles de veces por hora; guardamos el resultado de cada consulta
+# (SQL normalizado + parámetros) con un TTL por entrada y desalojo LRU.
+
+class CacheLRU:
+    """
+    Caché en memoria con tamaño máximo, TTL por entrada y desalojo LRU.
+    Es segura entre hilos: los handlers síncronos de FastAPI corren en un threadpool.
+    """
+
+    def __init__(self, nombre, max_entradas=512, ttl=300):
+        self.nombre = nombre
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.expiraciones = 0
+        self.invalidaciones = 0
+
+    @property
+    def activa(self):
+        return self.max_entradas > 0 and self.ttl > 0
+
+    def obtener(self, clave):
+        """Devuelve (True, valor) si la clave está en caché y no expiró, o (False, None)"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return False, None
+            valor, expira = entrada
+            if expira < time.monotonic():
+                del self._entradas[clave]
+                self.expiraciones += 1
+                self.fallos += 1
+                return False, None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return True, valor
+
+    def guardar(self, clave, valor, ttl=None):
+        """Guarda un valor; si se supera el tamaño máximo se desaloja el menos usado"""
+        if not self.activa:
+            return
+        expira = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entradas[clave] = (valor, expira)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.desalojos += 1
+
+    def invalidar(self, predicado=None):
+        """Elimina todas las entradas, o solo las que cumplen predicado(clave). Devuelve cuántas"""
+        with self._lock:
+            if predicado is None:
+                eliminadas = len(self._entradas)
+                self._entradas.clear()
+            else:
+                claves = [clave for clave in self._entradas if predicado(clave)]
+                for clave in claves:
+                    del self._entradas[clave]
+                eliminadas = len(claves)
+            self.invalidaciones += eliminadas
+            return eliminadas
+
+    def estadisticas(self):
+        """Contadores de aciertos, fallos y desalojos"""
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "nombre": self.nombre,
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "ttl_segundos": self.ttl,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0,
+                "desalojos": self.desalojos,
+                "expiraciones": self.expiraciones,
+                "invalidaciones": self.invalidaciones,
+            }
+
+# Literales entre comillas: no se deben tocar al normalizar los espacios
+_LITERALES = re.compile(r"""('(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`[^`]*`)""")
+_ESPACIOS = re.compile(r"\s+")
+_LECTURA = re.compile(r"^\s*(?:\(\s*)*(SELECT|WITH|SHOW|DESCRIBE|EXPLAIN)\b", re.IGNORECASE)
+
+def normalizar_sql(query_text):
+    """Colapsa los espacios fuera de los literales para que el mismo SQL tenga la misma clave"""
+    partes = _LITERALES.split(query_text)
+    for i in range(0, len(partes), 2):
+        partes[i] = _ESPACIOS.sub(" ", partes[i])
+    return "".join(partes).strip()
+
+def es_lectura(query_text):
+    """Indica si la sentencia solo lee datos (y por lo tanto se puede cachear)"""
+    return _LECTURA.match(query_text) is not None
+
+def _congelar(valor):
+    """Convierte un parámetro en algo hashable (las listas de IN llegan como listas)"""
+    if isinstance(valor, (list, tuple, set)):
+        return tuple(_congelar(v) for v in valor)
+    if isinstance(valor, dict):
+        return tuple(sorted((k, _congelar(v)) for k, v in valor.items()))
+    return valor
+
+def clave_consulta(tipo, query_text, params=None):
+    """Clave de caché: tipo de resultado + SQL normalizado + parámetros"""
+    return (tipo, normalizar_sql(query_text), _congelar(params or {}))
+
+# ----- VERSIÓN DE LOS DATOS -----
+# Cada vez que se invalidan las cachés o se recarga el snapshot los datos pueden
+# haber cambiado; las cachés derivadas (p. ej. los gráficos) usan esta versión en su clave.
+
+_version_datos = 0
+_lock_version = threading.Lock()
+
+def version_datos():
+    """Versión actual de los datos"""
+    return _version_datos
+
+def marcar_datos_modificados():
+    """Incrementa la versión de los datos; las entradas con la versión anterior dejan de usarse"""
+    global _version_datos
+    with _lock_version:
+        _version_datos += 1
+        return _version_datos
+
+# ----- CACHÉ DE CONSULTAS -----
+
+cache_consultas = CacheLRU(
+    "consultas",
+    max_entradas=env_int("QUERY_CACHE_MAX_ENTRIES", 512),
+    ttl=env_int("QUERY_CACHE_TTL", 300),
+)
+
+def invalidar_cache_consultas(tabla=None):
+    """Invalida todas las consultas cacheadas, o solo las que mencionan una tabla"""
+    marcar_datos_modificados()
+    if tabla is None:
+        return cache_consultas.invalidar()
+    patron = re.compile(rf"\b{re.escape(tabla)}\b", re.IGNORECASE)
+    return cache_consultas.invalidar(lambda clave: patron.search(clave[1]) is not None)
+
+# ----- CACHÉ DE GRÁFICOS -----
+
+class CacheBytes:
+    """
+    Caché LRU de contenidos binarios (imágenes) con límite en bytes.
+    Lo que se desaloja de memoria puede pasar a disco si hay un directorio configurado,
+    con su propio límite. Cada entrada guarda su ETag fuerte (hash del contenido).
+    """
+
+    def __init__(self, nombre, max_bytes, ttl=300, directorio=None, max_bytes_disco=0):
+        self.nombre = nombre
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directorio = directorio
+        self.max_bytes_disco = max_bytes_disco if directorio else 0
+        self._memoria = OrderedDict()
+        self._disco = OrderedDict()
+        self._bytes_memoria = 0
+        self._bytes_disco = 0
+        self._lock = threading.Lock()
+        self.aciertos_memoria = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.volcados_disco = 0
+        if self.max_bytes_disco:
+            os.makedirs(directorio, exist_ok=True)
+
+    @property
+    def activa(self):
+        return self.max_bytes > 0 and self.ttl > 0
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, hashlib.sha256(repr(clave).encode()).hexdigest() + ".bin")
+
+    def obtener(self, clave):
+        """Devuelve la entrada (contenido, media_type, etag) o None"""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None and entrada["expira"] >= ahora:
+                self._memoria.move_to_end(clave)
+                self.aciertos_memoria += 1
+                return entrada
+            if entrada is not None:
+                self._quitar_memoria(clave)
+
+            meta = self._disco.pop(clave, None)
+            if meta is not None:
+                self._bytes_disco -= meta["tamano"]
+                ruta = self._ruta(clave)
+                try:
+                    if meta["expira"] >= ahora:
+                        with open(ruta, "rb") as archivo:
+                            contenido = archivo.read()
+                        entrada = dict(meta, contenido=contenido)
+                        self._poner_memoria(clave, entrada)
+                        self.aciertos_disco += 1
+                        return entrada
+                except OSError:
+                    pass
+                finally:
+                    # Al volver a memoria (o expirar) el archivo ya no hace falta
+                    try:
+                        os.remove(ruta)
+                    except OSError:
+                        pass
+
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave, contenido, media_type):
+        """Guarda un contenido y devuelve la entrada con su ETag"""
+        entrada = {
+            "contenido": contenido,
+            "media_type": media_type,
+            "etag": '"' + hashlib.sha256(contenido).hexdigest()[:32] + '"',
+            "tamano": len(contenido),
+            "expira": time.monotonic() + self.ttl,
+        }
+        if not self.activa or len(contenido) > self.max_bytes:
+            return entrada
+        with self._lock:
+            if clave in self._memoria:
+                self._quitar_memoria(clave)
+            self._poner_memoria(clave, entrada)
+        return entrada
+
+    def _quitar_memoria(self, clave):
+        entrada = self._memoria.pop(clave)
+        self._bytes_memoria -= entrada["tamano"]
+        return entrada
+
+    def _poner_memoria(self, clave, entrada):
+        self._memoria[clave] = entrada
+        self._bytes_memoria += entrada["tamano"]
+        while self._bytes_memoria > self.max_bytes:
+            clave_vieja, vieja = next(iter(self._memoria.items()))
+            self._quitar_memoria(clave_vieja)
+            self.desalojos += 1
+            self._volcar_disco(clave_vieja, vieja)
+
+    def _volcar_disco(self, clave, entrada):
+        """Pasa a disco una entrada desalojada de memoria, si hay espacio configurado"""
+        if not self.max_bytes_disco or entrada["tamano"] > self.max_bytes_disco:
+            return
+        try:
+            with open(self._ruta(clave), "wb") as archivo:
+                archivo.write(entrada["contenido"])
+        except OSError:
+            return
+        self._disco[clave] = {k: v for k, v in entrada.items() if k != "contenido"}
+        self._bytes_disco += entrada["tamano"]
+        self.volcados_disco += 1
+        while self._bytes_disco > self.max_bytes_disco:
+            clave_vieja, meta = self._disco.popitem(last=False)
+            self._bytes_disco -= meta["tamano"]
+            try:
+                os.remove(self._ruta(clave_vieja))
+            except OSError:
+                pass
+
+    def invalidar(self):
+        """Vacía la caché en memoria y en disco. Devuelve cuántas entradas se eliminaron"""
+        with self._lock:
+            eliminadas = len(self._memoria) + len(self._disco)
+            for clave in self._disco:
+                try:
+                    os.remove(self._ruta(clave))
+                except OSError:
+                    pass
+            self._memoria.clear()
+            self._disco.clear()
+            self._bytes_memoria = 0
+            self._bytes_disco = 0
+            return eliminadas
+
+    def estadisticas(self):
+        """Contadores de aciertos (memoria/disco), fallos, desalojos y bytes ocupados"""
+        with self._lock:
+            aciertos = self.aciertos_memoria + self.aciertos_disco
+            consultas = aciertos + self.fallos
+            return {
+                "nombre": self.nombre,
+                "entradas_memoria": len(self._memoria),
+                "bytes_memoria": self._bytes_memoria,
+                "max_bytes": self.max_bytes,
+                "entradas_disco": len(self._disco),
+                "bytes_disco": self._bytes_disco,
+                "max_bytes_disco": self.max_bytes_disco,
+                "ttl_segundos": self.ttl,
+                "aciertos_memoria": self.aciertos_memoria,
+                "aciertos_disco": self.aciertos_disco,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(aciertos / consultas, 4) if consultas else 0.0,
+                "desalojos": self.desalojos,
+                "volcados_disco": self.volcados_disco,
+                "version_datos": version_datos(),
+            }
+
+cache_graficos = CacheBytes(
+    "graficos",
+    max_bytes=env_int("CHART_CACHE_MAX_MB", 64) * 1024 * 1024,
+    ttl=env_int("CHART_CACHE_TTL", 3600),
+    directorio=os.getenv("CHART_CACHE_DIR") or None,
+    max_bytes_disco=env_int("CHART_CACHE_DISK_MAX_MB", 256) * 1024 * 1024,
+)
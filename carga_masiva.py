@@ -0,0 +1,337 @@
+"""
+Carga masiva de los volcados de sql/ (sintaxis de Oracle) en la base de datos.
+
+Los archivos 01-04 usan number(11), varchar2 e INSERT ALL ... INTO ... SELECT * FROM dual,
+que MySQL no entiende. Este script los lee línea a línea (sin cargarlos enteros en
+memoria), traduce las tablas, y manda las filas en lotes grandes (executemany) dentro de
+una única transacción. Mientras dura la carga se desactivan las comprobaciones que se
+pueden diferir: FOREIGN_KEY_CHECKS y UNIQUE_CHECKS en MySQL; en SQLite los PRAGMA de
+sincronización y los índices secundarios, que se recrean al final.
+
+Uso:
+    python carga_masiva.py                                   # sql/01..04 en DATABASE_URL
+    python carga_masiva.py --url sqlite:////tmp/superheroes.db --vaciar
+    python carga_masiva.py sql/04_hero_power.sql --lote 2000
+    python carga_masiva.py --url sqlite:////tmp/superheroes.db --esquema sql/init_superheroes_db.sql
+"""
+import argparse
+import glob
+import os
+import re
+import time
+from collections import defaultdict
+
+from sqlalchemy import text, inspect
+
+from database import get_engine, crear_engine
+
+# Volcados que se cargan si no se indican archivos (en orden de dependencias)
+VOLCADOS = ["01_reference_data.sql", "02_superhero.sql", "03_hero_attribute.sql", "04_hero_power.sql"]
+
+# En el volcado attribute se llama attrs (es palabra reservada en Oracle)
+TABLAS_RENOMBRADAS = {"attrs": "attribute"}
+
+# Filas por executemany
+LOTE_POR_DEFECTO = 5000
+
+_CREATE = re.compile(r"^CREATE\s+TABLE\s+(\w+)\s*\(", re.IGNORECASE)
+_FILA = re.compile(r"^(?:INSERT\s+)?INTO\s+(\w+)\s*\(([^)]*)\)\s*VALUES\s*\((.*)\)\s*;?\s*(?:--.*)?$",
+                   re.IGNORECASE | re.DOTALL)
+_VALOR = re.compile(r"\s*('(?:[^']|'')*'|NULL|[-+]?\d+(?:\.\d+)?)\s*(,|$)", re.IGNORECASE | re.DOTALL)
+_TIPOS_ORACLE = [
+    (re.compile(r"\bnumber\s*\(\s*\d+\s*\)", re.IGNORECASE), "INTEGER"),
+    (re.compile(r"\bvarchar2\s*\(", re.IGNORECASE), "VARCHAR("),
+]
+
+def _tabla(nombre):
+    return TABLAS_RENOMBRADAS.get(nombre.lower(), nombre.lower())
+
+def _valores(texto):
+    """Convierte el contenido de VALUES (...) en una tupla de Python"""
+    valores, posicion = [], 0
+    while posicion < len(texto):
+        encontrado = _VALOR.match(texto, posicion)
+        if encontrado is None:
+            raise ValueError(f"No se pudo interpretar VALUES ({texto})")
+        token = encontrado.group(1)
+        if token.startswith("'"):
+            # Oracle escapa la comilla duplicándola
+            valores.append(token[1:-1].replace("''", "'"))
+        elif token.upper() == "NULL":
+            valores.append(None)
+        elif "." in token:
+            valores.append(float(token))
+        else:
+            valores.append(int(token))
+        posicion = encontrado.end()
+        if encontrado.group(2) != ",":
+            break
+    return tuple(valores)
+
+def traducir_create(sentencia):
+    """CREATE TABLE de Oracle -> SQL que aceptan MySQL y SQLite (tipos y tablas renombradas)"""
+    for patron, reemplazo in _TIPOS_ORACLE:
+        sentencia = patron.sub(reemplazo, sentencia)
+    sentencia = re.sub(r"\b(CREATE\s+TABLE|REFERENCES)\s+(\w+)",
+                       lambda m: f"{m.group(1)} {_tabla(m.group(2))}", sentencia, flags=re.IGNORECASE)
+    return sentencia.rstrip().rstrip(";")
+
+def leer_volcado(ruta):
+    """
+    Recorre un volcado línea a línea y genera eventos:
+    ("tabla", nombre, CREATE TABLE traducido) y ("fila", nombre, columnas, valores).
+    """
+    pendiente = []
+    with open(ruta, encoding="utf-8") as archivo:
+        for numero, linea in enumerate(archivo, start=1):
+            if not pendiente:
+                limpia = linea.strip()
+                if not limpia or limpia.startswith("--"):
+                    continue
+                if not (_CREATE.match(limpia) or limpia.upper().startswith(("INTO ", "INSERT INTO "))):
+                    # INSERT ALL, SELECT * FROM dual y demás sentencias sin datos
+                    continue
+            pendiente.append(linea)
+            bloque = "".join(pendiente).strip()
+
+            if _CREATE.match(bloque):
+                if not bloque.endswith(";"):
+                    continue
+                pendiente = []
+                yield ("tabla", _tabla(_CREATE.match(bloque).group(1)), traducir_create(bloque))
+                continue
+
+            # Una fila puede seguir en la línea siguiente si un texto contiene un salto de línea
+            if bloque.count("'") % 2:
+                continue
+            pendiente = []
+            fila = _FILA.match(bloque)
+            if fila is None:
+                raise ValueError(f"{os.path.basename(ruta)}:{numero}: fila no reconocida: {bloque[:80]}")
+            columnas = tuple(c.strip().lower() for c in fila.group(2).split(","))
+            valores = _valores(fila.group(3))
+            if len(valores) != len(columnas):
+                raise ValueError(f"{os.path.basename(ruta)}:{numero}: {len(columnas)} columnas y {len(valores)} valores")
+            yield ("fila", _tabla(fila.group(1)), columnas, valores)
+    if pendiente:
+        raise ValueError(f"{os.path.basename(ruta)}: sentencia incompleta al final del archivo")
+
+# ----- COMPROBACIONES DIFERIDAS -----
+
+def _diferir_mysql(conn):
+    """Desactiva las comprobaciones de claves foráneas y únicas de la sesión; devuelve cómo restaurarlas"""
+    previas = conn.execute(text("SELECT @@SESSION.foreign_key_checks, @@SESSION.unique_checks")).one()
+    conn.execute(text("SET SESSION foreign_key_checks = 0, unique_checks = 0"))
+    return [f"SET SESSION foreign_key_checks = {int(previas[0])}, unique_checks = {int(previas[1])}"]
+
+def _diferir_sqlite(conn):
+    """Sin fsync ni journal en disco durante la carga (se restaura al terminar)"""
+    previas = {pragma: conn.execute(text(f"PRAGMA {pragma}")).scalar()
+               for pragma in ("foreign_keys", "synchronous", "journal_mode")}
+    conn.execute(text("PRAGMA foreign_keys = OFF"))
+    conn.execute(text("PRAGMA synchronous = OFF"))
+    conn.execute(text("PRAGMA journal_mode = MEMORY"))
+    return [f"PRAGMA {pragma} = {valor}" for pragma, valor in previas.items()]
+
+_DIFERIR = {"mysql": _diferir_mysql, "sqlite": _diferir_sqlite}
+
+def _quitar_indices_sqlite(conn, tabla):
+    """Borra los índices secundarios de una tabla y devuelve su CREATE INDEX para recrearlos"""
+    filas = conn.execute(text("SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+                              "AND tbl_name = :tabla AND sql IS NOT NULL"), {"tabla": tabla}).all()
+    for nombre, _ in filas:
+        conn.execute(text(f'DROP INDEX "{nombre}"'))
+    return [sql for _, sql in filas]
+
+# ----- CARGA -----
+
+class CargaMasiva:
+    """Acumula las filas por tabla y las inserta en lotes dentro de la transacción abierta"""
+
+    def __init__(self, conn, lote=LOTE_POR_DEFECTO, crear_tablas=True, vaciar=False, diferir=True):
+        self.conn = conn
+        self.dialecto = conn.dialect.name
+        self.lote = max(int(lote), 1)
+        self.crear_tablas = crear_tablas
+        self.vaciar = vaciar
+        self.diferir = diferir
+        self.existentes = set(inspect(conn).get_table_names())
+        self.columnas = {}
+        self.ignoradas = defaultdict(set)
+        self.indices = []
+        self.pendientes = defaultdict(list)
+        self.filas = defaultdict(int)
+        self.segundos_insercion = defaultdict(float)
+
+    def tabla(self, nombre, create):
+        """Crea la tabla del volcado si la base de datos todavía no la tiene"""
+        if nombre not in self.existentes and self.crear_tablas:
+            self.conn.execute(text(create))
+            self.existentes.add(nombre)
+
+    def _preparar(self, nombre):
+        """Antes de la primera fila de una tabla: leer sus columnas, vaciarla y quitar sus índices secundarios"""
+        if nombre not in self.existentes:
+            raise ValueError(f"La tabla '{nombre}' no existe y no se creó (--sin-crear-tablas)")
+        self.columnas[nombre] = {c["name"].lower() for c in inspect(self.conn).get_columns(nombre)}
+        if self.vaciar:
+            self.conn.execute(text(f"DELETE FROM {nombre}"))
+        if self.diferir and self.dialecto == "sqlite":
+            self.indices.extend(_quitar_indices_sqlite(self.conn, nombre))
+
+    def fila(self, nombre, columnas, valores):
+        clave = (nombre, columnas)
+        # El informe sigue el orden en que aparecen las tablas en los volcados
+        self.filas.setdefault(nombre, 0)
+        self.pendientes[clave].append(dict(zip(columnas, valores)))
+        if len(self.pendientes[clave]) >= self.lote:
+            self._volcar(clave)
+
+    def _volcar(self, clave):
+        filas = self.pendientes.pop(clave, None)
+        if not filas:
+            return
+        nombre, columnas = clave
+        if nombre not in self.columnas:
+            self._preparar(nombre)
+        # Las columnas del volcado que la tabla no tiene (p. ej. attribute_value en el
+        # esquema de init_superheroes_db.sql) se omiten y se informan
+        self.ignoradas[nombre].update(c for c in columnas if c not in self.columnas[nombre])
+        columnas = [c for c in columnas if c in self.columnas[nombre]]
+        sentencia = text(f"INSERT INTO {nombre} ({', '.join(columnas)}) "
+                         f"VALUES ({', '.join(':' + c for c in columnas)})")
+        inicio = time.perf_counter()
+        self.conn.execute(sentencia, filas)
+        self.segundos_insercion[nombre] += time.perf_counter() - inicio
+        self.filas[nombre] += len(filas)
+
+    def terminar(self):
+        """Inserta lo que queda en los lotes y recrea los índices quitados"""
+        for clave in list(self.pendientes):
+            self._volcar(clave)
+        for create_index in self.indices:
+            self.conn.execute(text(create_index))
+
+def cargar_volcados(rutas, engine=None, lote=LOTE_POR_DEFECTO, crear_tablas=True, vaciar=False, diferir=True):
+    """
+    Carga los volcados en orden, en una única transacción (si algo falla no queda nada a medias).
+    Devuelve un informe con filas, segundos y filas por segundo, en total y por tabla.
+    """
+    eventos = (evento for ruta in rutas for evento in leer_volcado(ruta))
+    return cargar_eventos(eventos, engine, lote, crear_tablas, vaciar, diferir)
+
+def cargar_eventos(eventos, engine=None, lote=LOTE_POR_DEFECTO, crear_tablas=True, vaciar=False, diferir=True):
+    """
+    Como cargar_volcados, pero con los eventos ("tabla", ...) y ("fila", ...) de cualquier
+    origen (por ejemplo, las filas generadas por datos_sinteticos.py)
+    """
+    engine = engine or get_engine()
+    inicio = time.perf_counter()
+    with engine.connect() as conn:
+        # Los PRAGMA de SQLite no tienen efecto dentro de una transacción: van antes de abrirla
+        restaurar = _DIFERIR[conn.dialect.name](conn) if diferir and conn.dialect.name in _DIFERIR else []
+        conn.commit()
+        try:
+            carga = CargaMasiva(conn, lote, crear_tablas, vaciar, diferir)
+            for evento in eventos:
+                if evento[0] == "tabla":
+                    carga.tabla(evento[1], evento[2])
+                else:
+                    carga.fila(*evento[1:])
+            carga.terminar()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            for sentencia in restaurar:
+                conn.execute(text(sentencia))
+            conn.commit()
+
+    segundos = time.perf_counter() - inicio
+    total = sum(carga.filas.values())
+    return {
+        "filas": total,
+        "segundos": round(segundos, 3),
+        "filas_por_segundo": round(total / segundos) if segundos else None,
+        "tablas": {
+            tabla: {
+                "filas": filas,
+                "segundos_insercion": round(carga.segundos_insercion[tabla], 3),
+                "filas_por_segundo": round(filas / carga.segundos_insercion[tabla]) if carga.segundos_insercion[tabla] else None,
+                "columnas_ignoradas": sorted(carga.ignoradas[tabla]),
+            }
+            for tabla, filas in carga.filas.items()
+        },
+    }
+
+# ----- SCRIPTS DE MYSQL (init_superheroes_db.sql) -----
+
+# Sentencias que eligen la base de datos: la elige la URL de conexión
+_SENTENCIAS_DE_BASE = re.compile(r"^(DROP\s+DATABASE|CREATE\s+DATABASE|USE)\b", re.IGNORECASE)
+
+def sentencias_script(ruta, dialecto="mysql"):
+    """
+    Sentencias de un script de MySQL, sin comentarios ni las de DROP/CREATE DATABASE y USE.
+    En SQLite, INT AUTO_INCREMENT PRIMARY KEY pasa a INTEGER PRIMARY KEY (autoincremental allí).
+    """
+    with open(ruta, encoding="utf-8") as archivo:
+        script = re.sub(r"--[^\n]*", "", archivo.read())
+    for sentencia in script.split(";"):
+        sentencia = sentencia.strip()
+        if not sentencia or _SENTENCIAS_DE_BASE.match(sentencia):
+            continue
+        if dialecto == "sqlite":
+            sentencia = re.sub(r"\bINT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b", "INTEGER PRIMARY KEY",
+                               sentencia, flags=re.IGNORECASE)
+        yield sentencia
+
+def ejecutar_script(ruta, engine=None, solo_esquema=False):
+    """
+    Ejecuta un script de MySQL como sql/init_superheroes_db.sql en una transacción.
+    Con solo_esquema=True se crean las tablas sin los INSERT de ejemplo (para cargar
+    después los volcados, que traen sus propios ids). Devuelve la cantidad de sentencias.
+    """
+    engine = engine or get_engine()
+    ejecutadas = 0
+    with engine.begin() as conn:
+        for sentencia in sentencias_script(ruta, conn.dialect.name):
+            if solo_esquema and sentencia.upper().startswith("INSERT"):
+                continue
+            conn.execute(text(sentencia))
+            ejecutadas += 1
+    return ejecutadas
+
+def volcados_por_defecto():
+    """Rutas de los volcados 01-04 junto a este archivo"""
+    directorio = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql")
+    return [os.path.join(directorio, nombre) for nombre in VOLCADOS]
+
+def imprimir_informe(informe):
+    print(f"{'tabla':<16} {'filas':>8} {'s inserción':>12} {'filas/s':>10}")
+    for tabla, datos in informe["tablas"].items():
+        print(f"{tabla:<16} {datos['filas']:>8} {datos['segundos_insercion']:>12.3f} {datos['filas_por_segundo'] or 0:>10}")
+        if datos["columnas_ignoradas"]:
+            print(f"  ⚠️ columnas que {tabla} no tiene y se omitieron: {', '.join(datos['columnas_ignoradas'])}")
+    print(f"{'total':<16} {informe['filas']:>8} {informe['segundos']:>12.3f} {informe['filas_por_segundo'] or 0:>10}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga masiva de los volcados de sql/ en la base de datos")
+    parser.add_argument("archivos", nargs="*", help="Volcados a cargar, en orden (por defecto sql/01..04); admite comodines")
+    parser.add_argument("--url", help="URL de SQLAlchemy (por defecto DATABASE_URL o las URLs habituales de la API)")
+    parser.add_argument("--lote", type=int, default=LOTE_POR_DEFECTO, help="Filas por executemany")
+    parser.add_argument("--vaciar", action="store_true", help="Borra el contenido de cada tabla antes de cargarla")
+    parser.add_argument("--sin-crear-tablas", dest="crear_tablas", action="store_false",
+                        help="No crea las tablas que falten (falla si no existen)")
+    parser.add_argument("--sin-diferir", dest="diferir", action="store_false",
+                        help="Mantiene las comprobaciones de claves e índices durante la carga")
+    parser.add_argument("--esquema", help="Script de MySQL con las tablas a crear antes de la carga "
+                                          "(por ejemplo sql/init_superheroes_db.sql; sus INSERT de ejemplo se omiten)")
+    args = parser.parse_args()
+
+    rutas = [r for patron in args.archivos for r in sorted(glob.glob(patron))] or volcados_por_defecto()
+    engine = crear_engine(args.url) if args.url else get_engine()
+    if args.esquema:
+        print(f"🧱 {ejecutar_script(args.esquema, engine, solo_esquema=True)} sentencias de {args.esquema}")
+    print(f"📦 Cargando {len(rutas)} volcados en {engine.url.render_as_string(hide_password=True)}")
+    imprimir_informe(cargar_volcados(rutas, engine, args.lote, args.crear_tablas, args.vaciar, args.diferir))
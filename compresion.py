@@ -0,0 +1,72 @@
+import gzip
+import io
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+
+from entorno import env_int
+
+# Compresión gzip de las respuestas (HTML, JSON, CSV sin comprimir, SVG).
+# Se diferencia del GZipMiddleware de Starlette en dos cosas:
+# - no vuelve a comprimir lo que ya viene comprimido (las exportaciones .csv.gz y
+#   Parquet, las imágenes PNG/WebP de los gráficos y toda respuesta que ya declare un
+#   Content-Encoding, como las exportaciones Arrow y Feather comprimidas con LZ4);
+# - en las respuestas en streaming vacía el compresor después de cada trozo, así el
+#   navegador recibe y puede mostrar cada parte de una tabla HTML sin esperar al final.
+
+# Tipos de contenido que ya están comprimidos
+TIPOS_YA_COMPRIMIDOS = (
+    "application/gzip",
+    "application/vnd.apache.parquet",
+    "image/png",
+    "image/webp",
+    "image/jpeg",
+)
+
+class _GzipConVaciado(gzip.GzipFile):
+    """GzipFile que hace un sync flush en cada escritura (cada trozo sale completo)"""
+
+    def write(self, datos):
+        escritos = super().write(datos)
+        self.flush()
+        return escritos
+
+class _RespondedorGZip(GZipResponder):
+    def __init__(self, app, minimum_size, compresslevel=6):
+        super().__init__(app, minimum_size, compresslevel=compresslevel)
+        # El GzipFile del padre ya escribió su cabecera en el buffer: se reemplazan ambos
+        self.gzip_buffer = io.BytesIO()
+        self.gzip_file = _GzipConVaciado(mode="wb", fileobj=self.gzip_buffer, compresslevel=compresslevel)
+        self.sin_comprimir = False
+
+    async def send_with_gzip(self, message):
+        if message["type"] == "http.response.start":
+            cabeceras = Headers(raw=message["headers"])
+            tipo = cabeceras.get("content-type", "")
+            # Arrow IPC se sirve con y sin LZ4 (con el mismo tipo): la exportación comprimida
+            # lo indica con Content-Encoding: identity
+            self.sin_comprimir = (tipo.split(";")[0].strip().lower() in TIPOS_YA_COMPRIMIDOS
+                                  or "content-encoding" in cabeceras)
+        if not self.sin_comprimir:
+            await super().send_with_gzip(message)
+        elif message["type"] == "http.response.start":
+            self.initial_message = message
+        else:
+            if not self.started:
+                self.started = True
+                await self.send(self.initial_message)
+            await self.send(message)
+
+class GZipSelectivo(GZipMiddleware):
+    """GZipMiddleware que respeta TIPOS_YA_COMPRIMIDOS y envía cada trozo del streaming al momento"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+            responder = _RespondedorGZip(self.app, self.minimum_size, compresslevel=self.compresslevel)
+            await responder(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+# Tamaño mínimo para comprimir y nivel de compresión (1-9)
+GZIP_MIN_BYTES = env_int("GZIP_MIN_BYTES", 1000)
+GZIP_NIVEL = env_int("GZIP_LEVEL", 6)
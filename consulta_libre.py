@@ -0,0 +1,264 @@
+import threading
+import time
+
+from sqlalchemy import event, text
+
+from cache import es_lectura
+from database import get_engine, crear_engine
+from entorno import env_int, env_float
+from metricas import medir
+
+# Límites de las consultas ad hoc de POST /query.
+# Van por un engine propio con CONCURRENCIA conexiones y un semáforo del mismo tamaño: una
+# consulta pesada ocupa uno de esos cupos y nunca una conexión del pool de los dashboards; si
+# están todos ocupados se responde 503 en lugar de encolar. Además cada consulta:
+# - se estima antes con EXPLAIN (en MySQL) y se rechaza si el plan examina demasiadas filas;
+# - tiene un tiempo máximo: MAX_EXECUTION_TIME en MySQL (max_statement_time en MariaDB) y un
+#   progress handler en SQLite, más el control del tiempo transcurrido mientras se leen filas;
+# - devuelve como mucho MAX_FILAS filas, leídas del cursor por bloques y enviadas en streaming.
+
+TIMEOUT_SEGUNDOS = env_float("ADHOC_QUERY_TIMEOUT", 15.0)
+MAX_FILAS = env_int("ADHOC_QUERY_MAX_ROWS", 10000)
+CONCURRENCIA = max(env_int("ADHOC_QUERY_CONCURRENCY", 2), 1)
+# Filas examinadas estimadas por EXPLAIN a partir de las cuales se rechaza la consulta (0 = sin límite)
+MAX_FILAS_ESTIMADAS = env_int("ADHOC_QUERY_MAX_COST", 50_000_000)
+
+# Filas por fetchmany
+FILAS_POR_BLOQUE = 1000
+
+# Cada cuántas instrucciones de SQLite se comprueba el tiempo máximo
+_PASOS_SQLITE = 10000
+
+# Códigos de error de "tiempo máximo de ejecución superado" (MySQL y MariaDB)
+_ERRORES_TIMEOUT = {3024, 1969}
+
+class ConsultaSaturada(Exception):
+    """Todos los cupos de consultas ad hoc están ocupados; el cliente debe reintentar más tarde"""
+
+class ConsultaDemasiadoCostosa(ValueError):
+    """El plan estimado de la consulta supera MAX_FILAS_ESTIMADAS"""
+
+class ConsultaTiempoAgotado(TimeoutError):
+    """La consulta superó TIMEOUT_SEGUNDOS antes de devolver la primera fila"""
+
+_engine = None
+_lock_engine = threading.Lock()
+_cupos = threading.BoundedSemaphore(CONCURRENCIA)
+_lock_estadisticas = threading.Lock()
+_estadisticas = {"ejecutadas": 0, "en_curso": 0, "rechazadas_saturacion": 0, "rechazadas_costo": 0,
+                 "timeouts": 0, "truncadas": 0, "errores": 0}
+
+def _contar(clave, valor=1):
+    with _lock_estadisticas:
+        _estadisticas[clave] += valor
+
+def _limitar_sesion_mysql(engine):
+    """Tiempo máximo por sentencia en cada conexión nueva del engine ad hoc"""
+    milisegundos = int(TIMEOUT_SEGUNDOS * 1000)
+
+    @event.listens_for(engine, "connect")
+    def _al_conectar(conexion_dbapi, _registro):
+        cursor = conexion_dbapi.cursor()
+        if engine.dialect.is_mariadb:
+            cursor.execute(f"SET SESSION max_statement_time = {milisegundos / 1000}")
+        else:
+            cursor.execute(f"SET SESSION MAX_EXECUTION_TIME = {milisegundos}")
+        cursor.close()
+
+def get_engine_libre():
+    """Engine de las consultas ad hoc: misma base que get_engine(), con su propio pool chico"""
+    global _engine
+    if _engine is None:
+        with _lock_engine:
+            if _engine is None:
+                url = get_engine().url
+                if url.get_backend_name() == "sqlite":
+                    _engine = crear_engine(url.render_as_string(hide_password=False))
+                else:
+                    # read_timeout de pymysql: corta la espera si el servidor no respeta el límite
+                    _engine = crear_engine(url.render_as_string(hide_password=False), pool_size=CONCURRENCIA,
+                                           max_overflow=0, connect_args={"read_timeout": int(TIMEOUT_SEGUNDOS) + 5})
+                    if url.get_backend_name() == "mysql":
+                        _limitar_sesion_mysql(_engine)
+    return _engine
+
+# ----- ESTIMACIÓN DEL COSTO -----
+
+def _filas_examinadas(plan):
+    """
+    Filas examinadas según las filas de EXPLAIN de MySQL. En cada SELECT (mismo id) las tablas
+    se recorren en nested loop: la tabla i se lee una vez por cada fila que dejan pasar las
+    anteriores (rows × filtered). Los SELECT distintos (subconsultas, UNION) se suman.
+    """
+    por_select = {}
+    for fila in plan:
+        por_select.setdefault(fila.get("id"), []).append(fila)
+    total = 0.0
+    for filas in por_select.values():
+        combinaciones = 1.0
+        for fila in filas:
+            leidas = float(fila.get("rows") or 1)
+            total += combinaciones * leidas
+            combinaciones *= max(leidas * float(fila.get("filtered") or 100) / 100, 1.0)
+    return total
+
+def estimar_costo(conn, query):
+    """
+    Filas examinadas estimadas por EXPLAIN, o None si la base de datos no da estimaciones
+    (SQLite no las da) o la sentencia no es un SELECT
+    """
+    if conn.dialect.name != "mysql" or not es_lectura(query) or query.lstrip().upper().startswith(("SHOW", "DESCRIBE", "EXPLAIN")):
+        return None
+    plan = [dict(fila._mapping) for fila in conn.execute(text(f"EXPLAIN {query}"))]
+    return _filas_examinadas(plan)
+
+# ----- EJECUCIÓN -----
+
+def _es_timeout(error, inicio):
+    codigo = getattr(getattr(error, "orig", None), "args", (None,))[0]
+    return (codigo in _ERRORES_TIMEOUT or "interrupted" in str(error).lower()
+            or time.perf_counter() - inicio >= TIMEOUT_SEGUNDOS)
+
+class ResultadoLibre:
+    """
+    Resultado de una consulta ad hoc en curso: columnas, el primer bloque ya leído y el resto
+    a medida que se recorre bloques(). Retiene la conexión y el cupo hasta cerrar().
+    """
+
+    def __init__(self, conn, result, inicio, max_filas):
+        self._conn = conn
+        self._result = result
+        self._inicio = inicio
+        self._cerrado = False
+        self._lock = threading.Lock()
+        self.max_filas = max_filas
+        self.columnas = list(result.keys()) if result.returns_rows else []
+        self.filas = 0
+        self.truncado = False
+        self.motivo = None
+        self._agotado = not result.returns_rows
+        self._enviando = False
+        # El primer bloque se lee ya: si la consulta falla o se agota el tiempo, todavía se
+        # puede responder con un error en lugar de cortar una respuesta a medias
+        self._primero = self._leer() if result.returns_rows else []
+        if self.motivo == "timeout" and not self._primero:
+            raise TimeoutError("Tiempo agotado antes de la primera fila")
+        self._enviando = True
+
+    def _leer(self):
+        if self.filas >= self.max_filas:
+            # Una fila más para saber si el resultado se cortó
+            if self._result.fetchone() is not None:
+                self.truncado, self.motivo = True, "max_filas"
+            return []
+        if time.perf_counter() - self._inicio >= TIMEOUT_SEGUNDOS:
+            self.truncado, self.motivo = True, "timeout"
+            return []
+        try:
+            with medir("db"):
+                filas = self._result.fetchmany(min(FILAS_POR_BLOQUE, self.max_filas - self.filas))
+        except Exception as e:
+            # Con la respuesta ya empezada, el tiempo agotado corta el resultado en lugar de fallar
+            if self._enviando and _es_timeout(e, self._inicio):
+                self.truncado, self.motivo = True, "timeout"
+                return []
+            raise
+        self.filas += len(filas)
+        self._agotado = len(filas) < FILAS_POR_BLOQUE and self.filas < self.max_filas
+        return filas
+
+    def bloques(self):
+        """Bloques de filas (tuplas) hasta agotar el resultado, max_filas o el tiempo máximo"""
+        try:
+            bloque = self._primero
+            while bloque:
+                yield [tuple(fila) for fila in bloque]
+                bloque = self._leer()
+        finally:
+            self.cerrar()
+
+    def pie(self):
+        """Campos finales de la respuesta JSON (se conocen al terminar de leer)"""
+        return {"count": self.filas, "truncado": self.truncado, "motivo": self.motivo, "max_filas": self.max_filas}
+
+    def cerrar(self):
+        """Libera la conexión y el cupo (se puede llamar más de una vez)"""
+        with self._lock:
+            if self._cerrado:
+                return
+            self._cerrado = True
+        try:
+            _quitar_timeout_sqlite(self._conn)
+            if self.truncado:
+                _contar("truncadas")
+            if self._agotado:
+                self._result.close()
+            else:
+                # Quedan filas sin leer (resultado cortado o cliente desconectado). Con un cursor
+                # del lado del servidor, cerrarlo las lee todas: es más barato descartar la conexión
+                self._conn.invalidate()
+            self._conn.close()
+        finally:
+            _contar("en_curso", -1)
+            _cupos.release()
+
+def _poner_timeout_sqlite(conn, inicio):
+    if conn.dialect.name == "sqlite" and not conn.invalidated:
+        limite = inicio + TIMEOUT_SEGUNDOS
+        # Un valor distinto de cero interrumpe la sentencia (OperationalError: interrupted)
+        conn.connection.driver_connection.set_progress_handler(lambda: time.perf_counter() > limite, _PASOS_SQLITE)
+
+def _quitar_timeout_sqlite(conn):
+    # Antes de devolver la conexión al pool, para que no interrumpa a la próxima consulta
+    if conn.dialect.name == "sqlite" and not conn.invalidated and not conn.closed:
+        conn.connection.driver_connection.set_progress_handler(None, 0)
+
+def ejecutar(query, max_filas=None):
+    """
+    Ejecuta una consulta ad hoc con los límites de este módulo y devuelve un ResultadoLibre
+    con el primer bloque leído. Lanza ConsultaSaturada, ConsultaDemasiadoCostosa o
+    ConsultaTiempoAgotado; quien lo recibe tiene que recorrer bloques() o llamar a cerrar().
+    """
+    max_filas = min(max_filas or MAX_FILAS, MAX_FILAS)
+    if not _cupos.acquire(blocking=False):
+        _contar("rechazadas_saturacion")
+        raise ConsultaSaturada(f"Hay {CONCURRENCIA} consultas ad hoc en curso; reintenta en unos segundos")
+    _contar("en_curso")
+    conn = None
+    inicio = time.perf_counter()
+    try:
+        conn = get_engine_libre().connect()
+        if MAX_FILAS_ESTIMADAS:
+            with medir("db"):
+                estimadas = estimar_costo(conn, query)
+            if estimadas is not None and estimadas > MAX_FILAS_ESTIMADAS:
+                _contar("rechazadas_costo")
+                raise ConsultaDemasiadoCostosa(
+                    f"El plan de la consulta examina unas {estimadas:,.0f} filas; el límite es {MAX_FILAS_ESTIMADAS:,}")
+        inicio = time.perf_counter()
+        _poner_timeout_sqlite(conn, inicio)
+        with medir("db"):
+            result = conn.execution_options(stream_results=True, max_row_buffer=FILAS_POR_BLOQUE).execute(text(query))
+        resultado = ResultadoLibre(conn, result, inicio, max_filas)
+    except Exception as e:
+        if conn is not None:
+            _quitar_timeout_sqlite(conn)
+            conn.close()
+        _contar("en_curso", -1)
+        _cupos.release()
+        if isinstance(e, ConsultaDemasiadoCostosa):
+            raise
+        if _es_timeout(e, inicio):
+            _contar("timeouts")
+            raise ConsultaTiempoAgotado(f"La consulta superó el tiempo máximo de {TIMEOUT_SEGUNDOS:g} s") from e
+        _contar("errores")
+        raise
+    _contar("ejecutadas")
+    return resultado
+
+def estadisticas():
+    """Límites configurados y contadores de las consultas ad hoc"""
+    with _lock_estadisticas:
+        contadores = dict(_estadisticas)
+    return {"timeout_segundos": TIMEOUT_SEGUNDOS, "max_filas": MAX_FILAS, "concurrencia": CONCURRENCIA,
+            "max_filas_estimadas": MAX_FILAS_ESTIMADAS, **contadores}
@@ -0,0 +1,203 @@
+import re
+import threading
+import time
+
+from sqlalchemy import make_url
+
+from database import execute_query, execute_dataframe_query, sentencia_sql, urls_candidatas
+from database_async import execute_query_async
+
+# Catálogo de consultas con nombre.
+# El SQL de cada consulta es fijo y los valores viajan como parámetros (:poder, :ids,
+# :limite), así el texto de la sentencia no cambia entre peticiones: SQLAlchemy reutiliza
+# la sentencia compilada, el driver se encarga de escapar los valores y no hay forma de
+# inyectar SQL desde la URL. Cada ejecución queda registrada (cantidad, errores y tiempos).
+
+_PARAMETRO = re.compile(r"(?<![:\w]):(\w+)")
+
+class ConsultaNombrada:
+    """Una consulta del catálogo: SQL con parámetros, los que son listas (IN) y sus estadísticas"""
+
+    def __init__(self, nombre, sql, listas=(), descripcion=""):
+        self.nombre = nombre
+        self.sql = sql
+        self.listas = tuple(listas)
+        self.descripcion = descripcion
+        self.parametros = tuple(dict.fromkeys(_PARAMETRO.findall(sql)))
+        self.ejecuciones = 0
+        self.errores = 0
+        self.filas = 0
+        self.segundos_total = 0.0
+        self.segundos_max = 0.0
+
+    def validar(self, params):
+        """Comprueba que lleguen exactamente los parámetros que usa el SQL"""
+        faltan = [p for p in self.parametros if p not in params]
+        sobran = [p for p in params if p not in self.parametros]
+        if faltan or sobran:
+            raise ValueError(f"Consulta '{self.nombre}': faltan {faltan or '-'}, sobran {sobran or '-'}")
+        for nombre in self.listas:
+            if not isinstance(params[nombre], (list, tuple)) or not params[nombre]:
+                raise ValueError(f"Consulta '{self.nombre}': :{nombre} debe ser una lista no vacía")
+
+    def sentencia(self):
+        """Sentencia de SQLAlchemy (la misma en cada llamada)"""
+        return sentencia_sql(self.sql, {nombre: [] for nombre in self.listas})
+
+    def estadisticas(self):
+        return {
+            "ejecuciones": self.ejecuciones,
+            "errores": self.errores,
+            "filas": self.filas,
+            "media_ms": round(self.segundos_total * 1000 / self.ejecuciones, 3) if self.ejecuciones else 0.0,
+            "max_ms": round(self.segundos_max * 1000, 3),
+            "total_ms": round(self.segundos_total * 1000, 3),
+        }
+
+CATALOGO = {}
+_lock_estadisticas = threading.Lock()
+
+def registrar(nombre, sql, listas=(), descripcion=""):
+    """Agrega una consulta al catálogo"""
+    if nombre in CATALOGO:
+        raise ValueError(f"La consulta '{nombre}' ya está registrada")
+    CATALOGO[nombre] = ConsultaNombrada(nombre, sql, listas, descripcion)
+    return CATALOGO[nombre]
+
+def consulta(nombre):
+    """Consulta registrada con ese nombre"""
+    try:
+        return CATALOGO[nombre]
+    except KeyError:
+        raise KeyError(f"La consulta '{nombre}' no está en el catálogo")
+
+# ----- CONSULTAS -----
+
+registrar("heroes_con_poder", """
+    SELECT s.superhero_name as 'Superhéroe',
+           COUNT(hp.power_id) as 'Cantidad de Poderes'
+    FROM superhero s
+    JOIN hero_power hp ON s.id = hp.hero_id
+    WHERE hp.power_id IN :ids
+    GROUP BY s.superhero_name
+    ORDER BY COUNT(hp.power_id) DESC
+    LIMIT :limite
+""", listas=["ids"], descripcion="Héroes con más poderes entre los poderes dados")
+
+registrar("comparar_heroes", """
+    SELECT sp.power_name as 'Poder',
+           MAX(CASE WHEN hp.hero_id IN :ids1 THEN 'Sí' ELSE 'No' END) as heroe1,
+           MAX(CASE WHEN hp.hero_id IN :ids2 THEN 'Sí' ELSE 'No' END) as heroe2
+    FROM superpower sp
+    JOIN hero_power hp ON sp.id = hp.power_id
+    WHERE hp.hero_id IN :ids
+    GROUP BY sp.power_name
+    ORDER BY sp.power_name
+""", listas=["ids1", "ids2", "ids"], descripcion="Poderes de dos grupos de héroes, lado a lado")
+
+registrar("atributos_por_genero", """
+    SELECT g.gender as 'Género',
+           a.attribute_name as 'Atributo',
+           COUNT(ha.hero_id) as 'Cantidad de Héroes'
+    FROM gender g
+    JOIN superhero s ON g.id = s.gender_id
+    JOIN hero_attribute ha ON s.id = ha.hero_id
+    JOIN attribute a ON ha.attribute_id = a.id
+    GROUP BY g.gender, a.attribute_name
+    ORDER BY g.gender, COUNT(ha.hero_id) DESC
+""", descripcion="Héroes por género y atributo")
+
+registrar("poderes_por_editorial", """
+    SELECT sp.power_name as 'Poder',
+           COUNT(hp.hero_id) as 'Cantidad de Héroes'
+    FROM superpower sp
+    JOIN hero_power hp ON sp.id = hp.power_id
+    JOIN superhero s ON hp.hero_id = s.id
+    WHERE s.publisher_id IN :ids
+    GROUP BY sp.power_name
+    ORDER BY COUNT(hp.hero_id) DESC
+    LIMIT :limite
+""", listas=["ids"], descripcion="Poderes más comunes entre los héroes de las editoriales dadas")
+
+registrar("alturas_pesos", """
+    SELECT s.superhero_name,
+           s.height_cm,
+           s.weight_kg,
+           a.alignment,
+           g.gender
+    FROM superhero s
+    JOIN alignment a ON s.alignment_id = a.id
+    JOIN gender g ON s.gender_id = g.id
+    WHERE s.height_cm IS NOT NULL AND s.weight_kg IS NOT NULL
+""", descripcion="Altura, peso, alineación y género de cada héroe (gráfico de alturas y pesos)")
+
+# ----- EJECUCIÓN -----
+
+def _medir(entrada, inicio, filas=None, error=False):
+    segundos = time.perf_counter() - inicio
+    with _lock_estadisticas:
+        entrada.ejecuciones += 1
+        entrada.errores += int(error)
+        entrada.filas += filas or 0
+        entrada.segundos_total += segundos
+        entrada.segundos_max = max(entrada.segundos_max, segundos)
+
+def ejecutar(nombre, params=None, usar_cache=True):
+    """Ejecuta una consulta del catálogo y devuelve una lista de diccionarios"""
+    entrada = consulta(nombre)
+    params = params or {}
+    entrada.validar(params)
+    inicio = time.perf_counter()
+    try:
+        data = execute_query(entrada.sql, params, usar_cache)
+    except Exception:
+        _medir(entrada, inicio, error=True)
+        raise
+    _medir(entrada, inicio, len(data))
+    return data
+
+async def ejecutar_async(nombre, params=None, usar_cache=True):
+    """Versión asíncrona de ejecutar()"""
+    entrada = consulta(nombre)
+    params = params or {}
+    entrada.validar(params)
+    inicio = time.perf_counter()
+    try:
+        data = await execute_query_async(entrada.sql, params, usar_cache)
+    except Exception:
+        _medir(entrada, inicio, error=True)
+        raise
+    _medir(entrada, inicio, len(data))
+    return data
+
+def ejecutar_dataframe(nombre, params=None, usar_cache=True):
+    """Ejecuta una consulta del catálogo y devuelve un DataFrame"""
+    entrada = consulta(nombre)
+    params = params or {}
+    entrada.validar(params)
+    inicio = time.perf_counter()
+    try:
+        df = execute_dataframe_query(entrada.sql, params, usar_cache)
+    except Exception:
+        _medir(entrada, inicio, error=True)
+        raise
+    _medir(entrada, inicio, len(df))
+    return df
+
+def compilar_catalogo(url=None):
+    """
+    Crea las sentencias de todas las consultas y las compila con el dialecto de la base
+    de datos (sin conectarse), así un error de sintaxis aparece al arrancar y no en la
+    primera petición. Devuelve la cantidad de consultas compiladas.
+    """
+    dialecto = make_url(url or urls_candidatas()[0]).get_dialect()()
+    for entrada in CATALOGO.values():
+        entrada.sentencia().compile(dialect=dialecto)
+    return len(CATALOGO)
+
+def estadisticas_consultas():
+    """Ejecuciones, errores, filas y tiempos de cada consulta del catálogo"""
+    with _lock_estadisticas:
+        return {nombre: {"descripcion": entrada.descripcion, "parametros": list(entrada.parametros),
+                         **entrada.estadisticas()}
+                for nombre, entrada in CATALOGO.items()}
@@ -0,0 +1,140 @@
+import threading
+import numpy as np
+import pandas as pd
+
+from snapshot import get_snapshot, snapshot_actual
+from metricas import medido
+
+# Matriz de co-ocurrencia de poderes para /sql/combos-poderes.
+# El self-join de hero_power crece con el cuadrado de los poderes por héroe y se
+# repetía en cada petición. Aquí se construye una vez por versión del snapshot:
+# incidencia héroe×poder (dispersa, en formato CSR) y C = Xᵀ·X poder×poder.
+# Los TOP-k salen de una selección parcial (argpartition), no de ordenar todo.
+
+# Héroes por bloque al densificar la incidencia para el producto Xᵀ·X
+HEROES_POR_BLOQUE = 4096
+
+class MatrizCoocurrencia:
+    """Conteos de pares de poderes que comparten héroe, calculados a partir del snapshot"""
+
+    def __init__(self, snapshot):
+        self.version = snapshot.version
+        self.poderes = snapshot.referencias["superpower"]
+        hero_power = snapshot.hero_power
+
+        # El JOIN original usa hero_id tal cual (sin exigir que exista en superhero)
+        # y solo los poderes que existen en superpower
+        validas = (hero_power["hero_id"] >= 0) & (hero_power["poder"] >= 0)
+        heroes, filas = np.unique(hero_power["hero_id"][validas], return_inverse=True)
+        columnas = hero_power["poder"][validas]
+
+        # Incidencia en CSR: filas ordenadas por héroe + punteros de inicio de cada fila
+        orden = np.argsort(filas, kind="stable")
+        self.indices = columnas[orden].astype(np.int32)
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(filas, minlength=len(heroes))))).astype(np.int64)
+        self.matriz = self._producto(len(heroes), len(self.poderes))
+
+        # Pares (i < j) con frecuencia > 0; las posiciones siguen el orden de los ids,
+        # así que i < j equivale a hp1.power_id < hp2.power_id
+        i, j = np.triu_indices(len(self.poderes), k=1)
+        frecuencias = self.matriz[i, j]
+        con_pares = frecuencias > 0
+        self.pares_i = i[con_pares].astype(np.int32)
+        self.pares_j = j[con_pares].astype(np.int32)
+        self.pares_frecuencia = frecuencias[con_pares]
+
+    def _producto(self, n_heroes, n_poderes):
+        """Calcula Xᵀ·X por bloques de héroes para no densificar toda la incidencia"""
+        matriz = np.zeros((n_poderes, n_poderes), dtype=np.float64)
+        for inicio in range(0, n_heroes, HEROES_POR_BLOQUE):
+            fin = min(inicio + HEROES_POR_BLOQUE, n_heroes)
+            desde, hasta = self.indptr[inicio], self.indptr[fin]
+            filas = np.repeat(np.arange(fin - inicio), np.diff(self.indptr[inicio:fin + 1]))
+            bloque = np.zeros((fin - inicio, n_poderes), dtype=np.float32)
+            # add.at para contar filas duplicadas de hero_power igual que el JOIN
+            np.add.at(bloque, (filas, self.indices[desde:hasta]), 1)
+            matriz += bloque.T @ bloque
+        return np.rint(matriz).astype(np.int64)
+
+    @staticmethod
+    def _top(valores, top, *desempates):
+        """Índices de los TOP valores (mayor a menor) usando selección parcial"""
+        if top <= 0 or len(valores) == 0:
+            return np.array([], dtype=np.int64)
+        if top < len(valores):
+            candidatos = np.argpartition(-valores, top - 1)[:top]
+        else:
+            candidatos = np.arange(len(valores))
+        claves = [d[candidatos] for d in reversed(desempates)] + [-valores[candidatos]]
+        return candidatos[np.lexsort(claves)]
+
+    def top_combos(self, top):
+        """Los TOP pares de poderes que más veces aparecen juntos"""
+        elegidos = self._top(self.pares_frecuencia, top, self.pares_i, self.pares_j)
+        nombres = np.asarray(self.poderes.nombres, dtype=object)
+        return pd.DataFrame({
+            'Poder 1': nombres[self.pares_i[elegidos]],
+            'Poder 2': nombres[self.pares_j[elegidos]],
+            'Frecuencia': self.pares_frecuencia[elegidos],
+        })
+
+    def relacionados(self, posicion, top):
+        """Los TOP poderes que más veces aparecen junto a un poder dado"""
+        fila = self.matriz[posicion].copy()
+        fila[posicion] = 0
+        con_pares = np.flatnonzero(fila)
+        elegidos = con_pares[self._top(fila[con_pares], top, con_pares)]
+        nombres = np.asarray(self.poderes.nombres, dtype=object)
+        return pd.DataFrame({'Poder': nombres[elegidos], 'Frecuencia': fila[elegidos]})
+
+    def posicion_poder(self, nombre):
+        """Posición de un poder por nombre (sin distinguir mayúsculas), o None"""
+        nombres = pd.Series(np.asarray(self.poderes.nombres, dtype=object)).str.lower()
+        coincidencias = np.flatnonzero(nombres.to_numpy() == nombre.strip().lower())
+        return int(coincidencias[0]) if len(coincidencias) else None
+
+    def memoria(self):
+        """Memoria ocupada en bytes"""
+        return int(self.matriz.nbytes + self.indices.nbytes + self.indptr.nbytes
+                   + self.pares_i.nbytes + self.pares_j.nbytes + self.pares_frecuencia.nbytes)
+
+_matriz = None
+_lock_matriz = threading.Lock()
+
+def get_coocurrencia():
+    """Devuelve la matriz de la versión actual del snapshot, recalculándola si los datos cambiaron"""
+    snapshot = get_snapshot()
+    matriz = _matriz
+    if matriz is None or matriz.version != snapshot.version:
+        with _lock_matriz:
+            matriz = _actualizar(snapshot)
+    return matriz
+
+def coocurrencia_vigente():
+    """Indica si la matriz ya está calculada para el snapshot actual (usarla no toca la base de datos)"""
+    snapshot, matriz = snapshot_actual(), _matriz
+    return snapshot is not None and matriz is not None and matriz.version == snapshot.version
+
+def _actualizar(snapshot):
+    global _matriz
+    if _matriz is None or _matriz.version != snapshot.version:
+        _matriz = MatrizCoocurrencia(snapshot)
+    return _matriz
+
+@medido("dataframe")
+def get_top_combos_poderes(TOP):
+    """
+    Obtiene los TOP pares de poderes que más veces comparten superhéroe
+    """
+    return get_coocurrencia().top_combos(TOP)
+
+@medido("dataframe")
+def get_poderes_relacionados(poder, TOP):
+    """
+    Obtiene los TOP poderes que más veces aparecen junto a un poder dado
+    """
+    matriz = get_coocurrencia()
+    posicion = matriz.posicion_poder(poder)
+    if posicion is None:
+        return pd.DataFrame(columns=['Poder', 'Frecuencia'])
+    return matriz.relacionados(posicion, TOP)
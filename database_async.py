@@ -0,0 +1,117 @@
+import asyncio
+from sqlalchemy import text, inspect, make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.concurrency import run_in_threadpool
+
+from database import (get_engine, configuracion_pool, execute_query,
+                      get_tables, get_table_page, construir_select_pagina, armar_pagina, sentencia_sql)
+from cache import cache_consultas, clave_consulta, es_lectura
+from entorno import env_bool
+from metricas import medir
+from perfil_sql import instrumentar
+
+# Camino asíncrono hacia la base de datos para los handlers async def de main.py.
+# Con DB_ASYNC=1 las consultas van por un engine de SQLAlchemy asyncio (aiomysql para
+# MySQL, aiosqlite para SQLite) y no ocupan un hilo mientras esperan a la base de datos.
+# Sin DB_ASYNC se usan las funciones síncronas de database.py dentro del threadpool,
+# como hasta ahora. En ambos casos los aciertos de la caché se responden sin salir del event loop.
+
+# Driver síncrono -> driver asíncrono equivalente
+DRIVERS_ASYNC = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+_engine_async = None
+_lock_engine_async = asyncio.Lock()
+
+def async_habilitado():
+    """Indica si las consultas usan el engine asíncrono (variable DB_ASYNC)"""
+    return env_bool("DB_ASYNC", False)
+
+def url_async(url):
+    """Traduce la URL de un engine síncrono a la del driver asíncrono equivalente"""
+    url = make_url(url)
+    if url.drivername not in DRIVERS_ASYNC:
+        raise ValueError(f"No hay driver asíncrono configurado para {url.drivername}")
+    return url.set(drivername=DRIVERS_ASYNC[url.drivername])
+
+async def get_async_engine():
+    """
+    Devuelve el engine asíncrono compartido. La URL es la misma que encontró el
+    arranque síncrono (con sus reintentos y backoff), que se ejecuta en el threadpool.
+    """
+    global _engine_async
+    if _engine_async is None:
+        async with _lock_engine_async:
+            if _engine_async is None:
+                engine = await run_in_threadpool(get_engine)
+                url = url_async(engine.url)
+                if url.drivername.startswith("sqlite"):
+                    _engine_async = create_async_engine(url)
+                else:
+                    _engine_async = create_async_engine(url, **configuracion_pool())
+                # Los eventos de cursor se registran en el engine síncrono que envuelve
+                instrumentar(_engine_async.sync_engine)
+    return _engine_async
+
+async def dispose_async_engine():
+    """Cierra las conexiones del engine asíncrono (al apagar la aplicación)"""
+    global _engine_async
+    if _engine_async is not None:
+        await _engine_async.dispose()
+        _engine_async = None
+
+def _desde_cache(tipo, query_text, params, usar_cache):
+    """Busca una lectura en la caché; devuelve (cacheable, clave, encontrado, valor)"""
+    cacheable = usar_cache and cache_consultas.activa and es_lectura(query_text)
+    if not cacheable:
+        return False, None, False, None
+    clave = clave_consulta(tipo, query_text, params)
+    encontrado, valor = cache_consultas.obtener(clave)
+    return True, clave, encontrado, valor
+
+async def execute_query_async(query_text, params=None, usar_cache=True, ttl=None):
+    """Versión asíncrona de execute_query; comparte la caché de consultas"""
+    cacheable, clave, encontrado, data = _desde_cache("filas", query_text, params, usar_cache)
+    if encontrado:
+        return [dict(fila) for fila in data]
+    if not async_habilitado():
+        return await run_in_threadpool(execute_query, query_text, params, usar_cache, ttl)
+
+    engine = await get_async_engine()
+    with medir("db"):
+        async with engine.connect() as conn:
+            result = await conn.execute(sentencia_sql(query_text, params), params or {})
+            data = [dict(row._mapping) for row in result]
+
+    if cacheable:
+        cache_consultas.guardar(clave, data, ttl)
+        return [dict(fila) for fila in data]
+    return data
+
+async def get_tables_async():
+    """Versión asíncrona de get_tables"""
+    if not async_habilitado():
+        return await run_in_threadpool(get_tables)
+    engine = await get_async_engine()
+    async with engine.connect() as conn:
+        return await conn.run_sync(lambda conexion: inspect(conexion).get_table_names())
+
+async def get_table_page_async(table_name, limit=100, columnas=None, cursor=None):
+    """
+    Versión asíncrona de get_table_page. El SELECT se arma en el threadpool porque
+    consulta el esquema con el inspector síncrono; las filas se leen por el engine asíncrono.
+    """
+    if not async_habilitado():
+        return await run_in_threadpool(get_table_page, table_name, limit, columnas, cursor)
+    sql, params, salida, clave = await run_in_threadpool(construir_select_pagina, table_name, limit, columnas, cursor)
+    engine = await get_async_engine()
+    with medir("db"):
+        async with engine.connect() as conn:
+            result = await conn.execute(text(sql), params)
+            nombres = list(result.keys())
+            filas = result.fetchall()
+    return armar_pagina(nombres, filas, limit, salida, clave)
@@ -0,0 +1,185 @@
+"""
+Genera un catálogo sintético N veces más grande que el de los volcados de sql/ y lo carga.
+
+Cada héroe nuevo toma como plantilla un héroe real elegido al azar:
+- copia su género, colores, raza, editorial y alineación (así se mantienen las
+  distribuciones de las tablas de referencia y las combinaciones entre ellas);
+- altura y peso varían un ±5 % alrededor de los de la plantilla (0 y NULL se conservan);
+- tiene tantos poderes como la plantilla (la misma asimetría de poderes por héroe, con
+  los héroes sin poderes incluidos), elegidos sin repetición según la popularidad de
+  cada poder en hero_power;
+- tiene los mismos atributos que la plantilla, con valores tomados de los de ese atributo.
+
+El nombre lleva el id del héroe nuevo (Batman #1412), así los nombres siguen siendo únicos.
+Los volcados y las filas generadas se cargan juntos con carga_masiva.py (lotes, una sola
+transacción y comprobaciones diferidas), vaciando antes las tablas.
+
+Uso:
+    python datos_sinteticos.py --factor 10 --url sqlite:////tmp/superheroes_x10.db
+    python datos_sinteticos.py --factor 100 --url sqlite:////tmp/x100.db --esquema sql/init_superheroes_db.sql
+    python datos_sinteticos.py --factor 1000 --semilla 7          # en DATABASE_URL
+"""
+import argparse
+import itertools
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import carga_masiva
+from database import get_engine, crear_engine
+
+# Héroes nuevos generados por bloque (la elección de poderes usa una matriz héroes × poderes)
+HEROES_POR_BLOQUE = 5000
+
+# Variación relativa de altura y peso respecto de la plantilla
+VARIACION_MEDIDAS = 0.05
+
+class Plantilla:
+    """Héroes, poderes y atributos de los volcados, en arrays para muestrear"""
+
+    def __init__(self, eventos):
+        self.columnas_heroe = None
+        heroes = []
+        poderes = defaultdict(list)
+        atributos = defaultdict(list)
+        self.columnas_atributo = None
+        for evento in eventos:
+            if evento[0] != "fila":
+                continue
+            _, tabla, columnas, valores = evento
+            if tabla == "superhero":
+                self.columnas_heroe = columnas
+                heroes.append(valores)
+            elif tabla == "hero_power":
+                fila = dict(zip(columnas, valores))
+                poderes[fila["hero_id"]].append(fila["power_id"])
+            elif tabla == "hero_attribute":
+                self.columnas_atributo = columnas
+                fila = dict(zip(columnas, valores))
+                atributos[fila["hero_id"]].append(fila)
+        if not heroes:
+            raise ValueError("Los volcados no tienen filas de superhero")
+
+        self.heroes = heroes
+        self.indice = {nombre: i for i, nombre in enumerate(self.columnas_heroe)}
+        ids = [fila[self.indice["id"]] for fila in heroes]
+        self.max_id = max(ids)
+        # Poderes de cada plantilla y popularidad de cada poder
+        self.poderes = [poderes.get(id_heroe, []) for id_heroe in ids]
+        self.cantidad_poderes = np.array([len(p) for p in self.poderes])
+        todos = [p for lista in self.poderes for p in lista]
+        self.ids_poder, conteos = np.unique(todos, return_counts=True) if todos else (np.array([], int), np.array([]))
+        self.log_popularidad = np.log(conteos / conteos.sum()) if todos else np.array([])
+        # Atributos de cada plantilla y valores observados de cada atributo
+        self.atributos = [atributos.get(id_heroe, []) for id_heroe in ids]
+        self.valores_atributo = defaultdict(list)
+        for lista in self.atributos:
+            for fila in lista:
+                if "attribute_value" in fila:
+                    self.valores_atributo[fila["attribute_id"]].append(fila["attribute_value"])
+
+    def __len__(self):
+        return len(self.heroes)
+
+def _medida(rng, valores):
+    """Altura o peso con una variación de ±VARIACION_MEDIDAS (0 y NULL significan desconocido)"""
+    resultado = []
+    for valor in valores:
+        if not valor:
+            resultado.append(valor)
+        else:
+            resultado.append(round(valor * (1 + rng.uniform(-VARIACION_MEDIDAS, VARIACION_MEDIDAS))))
+    return resultado
+
+def _elegir_poderes(rng, plantilla, cantidades):
+    """
+    Para cada héroe del bloque, cantidades[i] poderes distintos según su popularidad:
+    muestreo sin reemplazo con la técnica de Gumbel (los k mayores de log p + ruido de Gumbel)
+    """
+    if not len(plantilla.ids_poder):
+        return [[] for _ in cantidades]
+    claves = plantilla.log_popularidad + rng.gumbel(size=(len(cantidades), len(plantilla.ids_poder)))
+    orden = np.argsort(-claves, axis=1)
+    cantidades = np.minimum(cantidades, len(plantilla.ids_poder))
+    return [plantilla.ids_poder[orden[i, :k]].tolist() for i, k in enumerate(cantidades.tolist())]
+
+def generar(plantilla, factor, semilla=42):
+    """
+    Eventos ("fila", tabla, columnas, valores) de los héroes sintéticos, sus poderes y sus
+    atributos, para llegar a factor veces la cantidad de héroes de la plantilla
+    """
+    rng = np.random.default_rng(semilla)
+    nuevos = round((factor - 1) * len(plantilla))
+    columnas = plantilla.columnas_heroe
+    i_id, i_nombre = plantilla.indice["id"], plantilla.indice["superhero_name"]
+    i_completo = plantilla.indice.get("full_name")
+    medidas = [plantilla.indice[c] for c in ("height_cm", "weight_kg") if c in plantilla.indice]
+
+    for inicio in range(0, nuevos, HEROES_POR_BLOQUE):
+        tam = min(HEROES_POR_BLOQUE, nuevos - inicio)
+        elegidas = rng.integers(0, len(plantilla), tam)
+        ids = (plantilla.max_id + 1 + inicio + np.arange(tam)).tolist()
+        filas = [list(plantilla.heroes[j]) for j in elegidas.tolist()]
+        for fila, id_heroe in zip(filas, ids):
+            fila[i_id] = id_heroe
+            fila[i_nombre] = f"{fila[i_nombre]} #{id_heroe}"
+            if i_completo is not None and fila[i_completo]:
+                fila[i_completo] = f"{fila[i_completo]} #{id_heroe}"
+        for indice in medidas:
+            for fila, valor in zip(filas, _medida(rng, [fila[indice] for fila in filas])):
+                fila[indice] = valor
+        for fila in filas:
+            yield ("fila", "superhero", columnas, tuple(fila))
+
+        for id_heroe, poderes in zip(ids, _elegir_poderes(rng, plantilla, plantilla.cantidad_poderes[elegidas])):
+            for id_poder in poderes:
+                yield ("fila", "hero_power", ("hero_id", "power_id"), (id_heroe, id_poder))
+
+        for id_heroe, j in zip(ids, elegidas.tolist()):
+            for fila in plantilla.atributos[j]:
+                nueva = dict(fila, hero_id=id_heroe)
+                observados = plantilla.valores_atributo.get(fila["attribute_id"])
+                if observados:
+                    nueva["attribute_value"] = observados[rng.integers(len(observados))]
+                yield ("fila", "hero_attribute", plantilla.columnas_atributo,
+                       tuple(nueva[c] for c in plantilla.columnas_atributo))
+
+def escalar(factor, engine=None, semilla=42, rutas=None, lote=carga_masiva.LOTE_POR_DEFECTO, diferir=True):
+    """
+    Vacía las tablas y carga los volcados más los héroes sintéticos hasta factor veces el
+    catálogo original. Devuelve el informe de carga_masiva.cargar_eventos.
+    """
+    if factor < 1:
+        raise ValueError("El factor de escala tiene que ser 1 o mayor")
+    rutas = rutas or carga_masiva.volcados_por_defecto()
+    # Los volcados son chicos (unos miles de filas): se leen una vez para la plantilla y la carga
+    base = [evento for ruta in rutas for evento in carga_masiva.leer_volcado(ruta)]
+    plantilla = Plantilla(base)
+    eventos = itertools.chain(base, generar(plantilla, factor, semilla))
+    informe = carga_masiva.cargar_eventos(eventos, engine or get_engine(), lote, vaciar=True, diferir=diferir)
+    informe["factor"] = factor
+    informe["heroes_originales"] = len(plantilla)
+    informe["heroes_sinteticos"] = round((factor - 1) * len(plantilla))
+    return informe
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--factor", type=float, required=True, help="Tamaño del catálogo respecto del original (10, 100, 1000...)")
+    parser.add_argument("--url", help="URL de SQLAlchemy (por defecto DATABASE_URL o las URLs habituales de la API)")
+    parser.add_argument("--semilla", type=int, default=42, help="Semilla del generador (misma semilla, mismos datos)")
+    parser.add_argument("--lote", type=int, default=carga_masiva.LOTE_POR_DEFECTO, help="Filas por executemany")
+    parser.add_argument("--esquema", help="Script de MySQL con las tablas a crear antes (por ejemplo sql/init_superheroes_db.sql)")
+    parser.add_argument("--sin-diferir", dest="diferir", action="store_false",
+                        help="Mantiene las comprobaciones de claves e índices durante la carga")
+    args = parser.parse_args()
+
+    engine = crear_engine(args.url) if args.url else get_engine()
+    if args.esquema:
+        print(f"🧱 {carga_masiva.ejecutar_script(args.esquema, engine, solo_esquema=True)} sentencias de {args.esquema}")
+    print(f"🧬 Generando un catálogo x{args.factor:g} en {engine.url.render_as_string(hide_password=True)}")
+    inicio = time.perf_counter()
+    informe = escalar(args.factor, engine, args.semilla, lote=args.lote, diferir=args.diferir)
+    carga_masiva.imprimir_informe(informe)
+    print(f"{informe['heroes_originales']} héroes originales + {informe['heroes_sinteticos']} sintéticos "
+          f"en {time.perf_counter() - inicio:.1f} s")
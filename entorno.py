@@ -0,0 +1,22 @@
+import os
+
+# Lectura de la configuración desde variables de entorno, compartida por todos los módulos.
+# No importa nada del proyecto, así cualquier módulo la puede usar sin importaciones circulares.
+# Una variable vacía o sin definir toma el valor por defecto.
+
+def env_int(nombre, defecto):
+    """Lee un entero de una variable de entorno"""
+    valor = os.getenv(nombre)
+    return int(valor) if valor not in (None, "") else defecto
+
+def env_float(nombre, defecto):
+    """Lee un número decimal de una variable de entorno"""
+    valor = os.getenv(nombre)
+    return float(valor) if valor not in (None, "") else defecto
+
+def env_bool(nombre, defecto):
+    """Lee un booleano de una variable de entorno (1/true/si/yes)"""
+    valor = os.getenv(nombre)
+    if valor in (None, ""):
+        return defecto
+    return valor.strip().lower() in ("1", "true", "si", "sí", "yes", "on")
@@ -1,60 +1,165 @@
-from fastapi.responses import HTMLResponse
+import math
+from html import escape
+from fastapi.responses import StreamingResponse
 
-def tabla_formato(tabla, titulo: str) -> HTMLResponse:
-    """
-    Convierte un DataFrame de pandas en una tabla HTML con formato bootstrap
-    
-    Args:
-        tabla: DataFrame de pandas
-        titulo: Título que se mostrará en la página
-        
-    Returns:
-        HTMLResponse: Respuesta HTML con la tabla formateada
-    """
-    tabla_html = tabla.to_html(
-        index=False,
-        classes='table table-bordered table-striped-columns table-hover text-center',
-    )
-    html_total = f"""
-    <!DOCTYPE html>
-    <html lang="es">
-    <head>
-        <meta charset="UTF-8">
-        <title>{titulo}</title>
+from entorno import env_int
+from metricas import medido, iterar_medido
+
+# Las tablas HTML se envían en streaming: primero la cabecera de la página, después las
+# filas en trozos a medida que se generan y al final la navegación. Así no se arma la
+# página entera en memoria antes de mandar el primer byte, y con la paginación del lado
+# del servidor (?pagina=, ?por_pagina=) y el orden (?orden=, ?desc=) el navegador nunca
+# recibe más filas de las que se muestran.
+
+# Filas por página si la URL no indica ?por_pagina= (0 = todas)
+FILAS_POR_PAGINA = env_int("HTML_FILAS_POR_PAGINA", 200)
+# Máximo de filas por página que se puede pedir
+MAX_FILAS_POR_PAGINA = 5000
+# Filas por cada trozo enviado
+FILAS_POR_TROZO = 100
+
+_ESTILO = """
         <link
           href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css"
           rel="stylesheet"
         >
         <style>
-            .table thead th {{
+            .table thead th {
                 text-align: center;
                 vertical-align: middle;
                 background-color: #3c0069;
-                color: white; 
-            }} 
-            body {{
+                color: white;
+            }
+            .table thead th a {
+                color: white;
+                text-decoration: none;
+            }
+            body {
                 background-color: #f8f9fa;
-            }}
-            .container {{
+            }
+            .container {
                 background-color: white;
                 border-radius: 10px;
                 box-shadow: 0 0 15px rgba(0,0,0,0.1);
                 padding: 25px;
-            }}
-            h2 {{
+            }
+            h2 {
                 color: #3c0069;
                 font-weight: bold;
-            }}
-        </style>    
+            }
+        </style>"""
+
+def _celda(valor):
+    """Texto escapado de una celda (vacío para NULL y NaN)"""
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return ""
+    return escape(str(valor))
+
+def _encabezado(columna, enlaces_orden):
+    """Celda de encabezado; si hay enlace, al hacer clic se ordena por esa columna"""
+    if not enlaces_orden or columna not in enlaces_orden:
+        return f"<th>{escape(str(columna))}</th>"
+    url, flecha = enlaces_orden[columna]
+    return f'<th><a href="{escape(url)}">{escape(str(columna))}{flecha}</a></th>'
+
+def stream_tabla_html(columnas, bloques, titulo, enlaces_orden=None, navegacion=""):
+    """
+    Genera la página HTML por partes: cabecera, filas (de cada bloque, en trozos) y pie.
+    bloques es un iterable de listas de filas (tuplas); puede venir directamente de un cursor.
+    enlaces_orden: columna -> (url, flecha) para los encabezados que ordenan.
+    """
+    # Cada trozo cuenta como serialización en /metrics (sin el tiempo de enviarlo)
+    return iterar_medido("serializacion", _generar_html(columnas, bloques, titulo, enlaces_orden, navegacion))
+
+def _generar_html(columnas, bloques, titulo, enlaces_orden, navegacion):
+    yield f"""<!DOCTYPE html>
+    <html lang="es">
+    <head>
+        <meta charset="UTF-8">
+        <title>{escape(titulo)}</title>{_ESTILO}
     </head>
     <body>
         <div class="container my-5">
-            <h2 class="text-center mb-4">{titulo}</h2>
+            <h2 class="text-center mb-4">{escape(titulo)}</h2>
             <div class="table-responsive">
-                {tabla_html}
+                <table class="dataframe table table-bordered table-striped-columns table-hover text-center">
+                <thead><tr>{"".join(_encabezado(c, enlaces_orden) for c in columnas)}</tr></thead>
+                <tbody>
+"""
+    for bloque in bloques:
+        for inicio in range(0, len(bloque), FILAS_POR_TROZO):
+            yield "".join("<tr>" + "".join(f"<td>{_celda(v)}</td>" for v in fila) + "</tr>\n"
+                          for fila in bloque[inicio:inicio + FILAS_POR_TROZO])
+    yield f"""                </tbody>
+                </table>
             </div>
+            {navegacion}
         </div>
     </body>
     </html>
     """
-    return HTMLResponse(content=html_total)
\ No newline at end of file
+
+def _entero(valor, defecto):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return defecto
+
+def navegacion_html(anterior=None, siguiente=None, texto=""):
+    """Enlaces de página anterior/siguiente y un texto en el medio"""
+    partes = []
+    if anterior:
+        partes.append(f'<a class="btn btn-outline-secondary btn-sm" href="{escape(anterior)}">&laquo; Anterior</a>')
+    if texto:
+        partes.append(f'<span class="mx-3 text-muted">{escape(texto)}</span>')
+    if siguiente:
+        partes.append(f'<a class="btn btn-outline-secondary btn-sm" href="{escape(siguiente)}">Siguiente &raquo;</a>')
+    return f'<nav class="d-flex justify-content-center align-items-center mt-3">{"".join(partes)}</nav>'
+
+@medido("serializacion")
+def tabla_formato(tabla, titulo: str, request=None, por_pagina=None) -> StreamingResponse:
+    """
+    Convierte un DataFrame de pandas en una tabla HTML con formato bootstrap, enviada en streaming
+
+    Args:
+        tabla: DataFrame de pandas
+        titulo: Título que se mostrará en la página
+        request: Petición actual; si se pasa, se leen ?pagina=, ?por_pagina=, ?orden= y ?desc=
+                 y se agregan los enlaces de orden y de navegación
+        por_pagina: Filas por página por defecto (FILAS_POR_PAGINA si se omite, 0 = todas)
+
+    Returns:
+        StreamingResponse: Respuesta HTML con la tabla formateada
+    """
+    parametros = request.query_params if request is not None else {}
+    orden = parametros.get("orden")
+    descendente = parametros.get("desc", "").lower() in ("1", "true", "si", "sí")
+    if orden in tabla.columns:
+        tabla = tabla.sort_values(orden, ascending=not descendente, kind="stable", na_position="last")
+
+    por_pagina = _entero(parametros.get("por_pagina"), FILAS_POR_PAGINA if por_pagina is None else por_pagina)
+    por_pagina = min(max(por_pagina, 0), MAX_FILAS_POR_PAGINA) if request is not None else 0
+    total = len(tabla)
+    paginas = max(math.ceil(total / por_pagina), 1) if por_pagina else 1
+    pagina = min(max(_entero(parametros.get("pagina"), 1), 1), paginas)
+    if por_pagina:
+        tabla = tabla.iloc[(pagina - 1) * por_pagina:pagina * por_pagina]
+
+    enlaces_orden, navegacion = None, ""
+    if request is not None:
+        enlaces_orden = {}
+        for columna in tabla.columns:
+            # Volver a pulsar la columna por la que ya se ordena invierte el sentido
+            invertir = columna == orden and not descendente
+            url = str(request.url.include_query_params(orden=columna, desc=int(invertir), pagina=1))
+            flecha = (" ▼" if descendente else " ▲") if columna == orden else ""
+            enlaces_orden[columna] = (url, flecha)
+        anterior = str(request.url.include_query_params(pagina=pagina - 1)) if pagina > 1 else None
+        siguiente = str(request.url.include_query_params(pagina=pagina + 1)) if pagina < paginas else None
+        navegacion = navegacion_html(anterior, siguiente, f"Página {pagina} de {paginas} · {total} filas")
+
+    # Las filas se convierten a tuplas por trozos, no todas de una vez
+    bloques = (list(tabla.iloc[i:i + FILAS_POR_TROZO].itertuples(index=False, name=None))
+               for i in range(0, len(tabla), FILAS_POR_TROZO))
+    return StreamingResponse(stream_tabla_html(list(tabla.columns), bloques, titulo, enlaces_orden, navegacion),
+                             media_type="text/html")
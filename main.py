@@ -1,19 +1,64 @@
-from fastapi import FastAPI, Query, HTTPException, Depends
+import time
+# Marcamos el inicio para medir el tiempo de arranque de la API
+_INICIO_ARRANQUE = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
 import pandas as pd
 import os
+from typing import List
 
 # Importar las funciones desde los módulos que ya tenemos
-from database import get_db, get_tables, get_table_data, execute_query, get_table_to_dataframe, export_table_to_csv, create_bar_chart, create_line_chart, get_database_schema
-from formato import tabla_formato
+from database import get_table_to_dataframe, create_bar_chart, create_line_chart, get_database_schema, estadisticas_pool, estado_conexion, TablaNoEncontrada, construir_select_tabla, stream_table_csv, stream_table_columnar, iterar_bloques_tabla, FILAS_POR_BLOQUE, FORMATOS_COLUMNARES
+from formato import stream_tabla_html, navegacion_html
+from negociacion import elegir_formato, responder_tabla, respuesta_dataframe, a_json, filas_ndjson, filas_csv, bloques_json, TIPOS_MIME
+from compresion import GZipSelectivo, GZIP_MIN_BYTES, GZIP_NIVEL
+import metricas
+import perfil_sql
 import pandas_consultas as pandas_mod  # Renombrado para evitar conflicto con la librería pandas
 import seaborn_consultas as seaborn_mod  # Renombrado para evitar conflicto con la librería seaborn
+import coocurrencia as coocurrencia_mod
+import similitud as similitud_mod
+import agregados as agregados_mod
+import busqueda as busqueda_mod
+import consultas as consultas_mod
+import consulta_libre
+from resumenes import resumen_vigente, aplicar_cambios, info_resumenes
+from snapshot import info_snapshot, refrescar_snapshot, invalidar_snapshot, snapshot_actual
+from database_async import get_tables_async, get_table_page_async, dispose_async_engine
+from starlette.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
+from render_graficos import pool_graficos, RenderSaturado
+from cache import cache_consultas, cache_graficos, invalidar_cache_consultas
+
+# Tiempo de arranque medido (importaciones + creación de la app), en segundos
+arranque = {"segundos": None}
+
+# La conexión a la base de datos se establece en el primer uso (con backoff),
+# así que el arranque no depende de que MySQL ya esté disponible
+@asynccontextmanager
+async def lifespan(app):
+    # Los workers de gráficos arrancan ya con matplotlib y seaborn importados,
+    # así el primer gráfico no paga el coste de las importaciones
+    try:
+        await run_in_threadpool(pool_graficos.iniciar)
+    except Exception as e:
+        print(f"⚠️ No se pudo iniciar el pool de gráficos: {e}")
+    # Las consultas del catálogo se compilan ahora (sin conectarse) para detectar errores al arrancar
+    print(f"📚 {consultas_mod.compilar_catalogo()} consultas del catálogo compiladas")
+    arranque["segundos"] = round(time.perf_counter() - _INICIO_ARRANQUE, 3)
+    print(f"🚀 API lista en {arranque['segundos']} s")
+    yield
+    pool_graficos.cerrar()
+    await dispose_async_engine()
 
 app = FastAPI(
     title="Superhero Database API",
     description="API para consultar la base de datos de superhéroes",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS para permitir solicitudes desde cualquier origen
@@ -24,48 +69,129 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Inicializar la base de datos al iniciar la aplicación
-@app.on_event("startup")
-def startup():
-    try:
-        # Verificamos la conexión a la base de datos
-        db = next(get_db())
-        print("✅ Conexión a la base de datos exitosa")
-        db.close()
-    except Exception as e:
-        print(f"❌ Error durante la inicialización: {str(e)}")
+# Compresión gzip de las respuestas (sin recomprimir las exportaciones .csv.gz/Parquet ni las imágenes)
+app.add_middleware(GZipSelectivo, minimum_size=GZIP_MIN_BYTES, compresslevel=GZIP_NIVEL)
+
+# Cabecera Server-Timing con la cantidad de consultas SQL y su tiempo en cada respuesta
+app.add_middleware(perfil_sql.PerfilPeticiones)
+
+# Conteo y latencia de las peticiones por ruta para /metrics (el último middleware agregado
+# es el más externo: la duración incluye la compresión y el perfil SQL)
+app.add_middleware(metricas.MedicionPeticiones)
 
 # Endpoint raíz
 @app.get("/")
 def read_root():
     return {"message": "Superhero Database API is running"}
 
+# Endpoint de vida: la API responde aunque la base de datos no esté lista
+@app.get("/health/live")
+def health_live():
+    return {"status": "ok", "arranque_segundos": arranque["segundos"]}
+
+# Endpoint de disponibilidad: comprueba el estado real de la base de datos
+@app.get("/health/ready")
+def health_ready():
+    estado = estado_conexion(verificar=True)
+    estado["arranque_segundos"] = arranque["segundos"]
+    codigo = 200 if estado["estado"] == "conectado" else 503
+    return JSONResponse(status_code=codigo, content=estado)
+
+# Las consultas sobre el snapshot en memoria tardan microsegundos y se resuelven en el
+# event loop. Si antes hay que cargar el snapshot (o reconstruir la matriz o el motor),
+# esa llamada va al threadpool para no bloquear al resto de las peticiones.
+async def _en_memoria(vigente, funcion, *args):
+    if vigente():
+        return funcion(*args)
+    return await run_in_threadpool(funcion, *args)
+
+def _snapshot_cargado():
+    return snapshot_actual() is not None
+
 # Endpoint para listar tablas
 @app.get("/tables")
-def list_tables():
+async def list_tables():
     try:
-        tables = get_tables()
+        tables = await get_tables_async()
         return {"tables": tables}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener tablas: {str(e)}")
 
 # Endpoint para obtener datos de una tabla
+# Paginación por clave primaria: next_cursor se pasa como ?cursor= para pedir la página siguiente
 @app.get("/tables/{table_name}")
-def get_table(table_name: str, limit: int = 100):
+async def get_table(request: Request, table_name: str,
+                    limit: int = Query(100, ge=1, le=10000, description="Filas por página"),
+                    cursor: str = Query(None, description="Cursor devuelto por la página anterior"),
+                    columnas: str = Query(None, description="Columnas a devolver separadas por comas (todas si se omite)"),
+                    formato: str = Query(None, description="json, ndjson (una fila JSON por línea, en streaming), csv, arrow o html (si se omite, según la cabecera Accept)")):
     try:
-        data = get_table_data(table_name, limit)
-        return {"table": table_name, "data": data, "count": len(data)}
+        lista_columnas = [c.strip() for c in columnas.split(",") if c.strip()] if columnas else None
+        formato = formato or elegir_formato(request, ("json", "ndjson", "csv", "arrow"), "json")
+        if formato not in ("json", "ndjson", "csv", "arrow", "html"):
+            raise ValueError(f"Formato desconocido: {formato}")
+        nombres, filas, siguiente = await get_table_page_async(table_name, limit, lista_columnas, cursor)
+        cabeceras = {"X-Next-Cursor": siguiente, "Vary": "Accept"} if siguiente else {"Vary": "Accept"}
+        if formato == "ndjson":
+            return StreamingResponse(filas_ndjson(nombres, filas), media_type=TIPOS_MIME["ndjson"], headers=cabeceras)
+        if formato == "csv":
+            return Response(filas_csv(nombres, filas), media_type=TIPOS_MIME["csv"], headers=cabeceras)
+        if formato == "arrow":
+            respuesta = respuesta_dataframe(pd.DataFrame.from_records(filas, columns=nombres), "arrow")
+            respuesta.headers.update(cabeceras)
+            return respuesta
+        if formato == "html":
+            # Página HTML en streaming con enlace a la página siguiente (por clave primaria)
+            url_siguiente = str(request.url.include_query_params(cursor=siguiente)) if siguiente else None
+            navegacion = navegacion_html(siguiente=url_siguiente, texto=f"{len(filas)} filas")
+            return StreamingResponse(stream_tabla_html(nombres, [filas], f"Tabla {table_name}", navegacion=navegacion),
+                                     media_type="text/html")
+        # orjson en lugar del codificador por defecto de FastAPI
+        data = [dict(zip(nombres, fila)) for fila in filas]
+        return Response(a_json({"table": table_name, "data": data, "count": len(data), "next_cursor": siguiente}),
+                        media_type=TIPOS_MIME["json"], headers=cabeceras)
+    except TablaNoEncontrada as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos de la tabla: {str(e)}")
 
 # Endpoint para ejecutar consultas SQL personalizadas
+# El resultado se devuelve en JSON, CSV o Arrow según la cabecera Accept, con los límites de
+# consulta_libre.py: cupos propios (503 si están ocupados), costo estimado, tiempo máximo y
+# como mucho ADHOC_QUERY_MAX_ROWS filas. El JSON se envía en streaming y termina con
+# "count" y "truncado"; en CSV y Arrow el corte se indica en la cabecera X-Truncado.
 @app.post("/query")
-def run_query(query: str):
+def run_query(request: Request, query: str,
+              max_filas: int = Query(None, ge=1, description="Filas a devolver como mucho (no supera ADHOC_QUERY_MAX_ROWS)")):
+    try:
+        formato = elegir_formato(request, ("json", "csv", "arrow"), "json")
+        # Las consultas ad hoc siempre van a la base de datos
+        resultado = consulta_libre.ejecutar(query, max_filas)
+    except consulta_libre.ConsultaSaturada as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except consulta_libre.ConsultaTiempoAgotado as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en la consulta: {str(e)}")
+    if formato == "json":
+        # Si el cliente se desconecta antes de leer todo, la tarea de fondo libera el cupo
+        return StreamingResponse(bloques_json("result", resultado.columnas, resultado.bloques(), resultado.pie),
+                                 media_type=TIPOS_MIME["json"], headers={"Vary": "Accept"},
+                                 background=BackgroundTask(resultado.cerrar))
     try:
-        data = execute_query(query)
-        return {"result": data, "count": len(data)}
+        # CSV y Arrow no tienen dónde indicar el corte al final: se arman con las filas ya limitadas
+        filas = [fila for bloque in resultado.bloques() for fila in bloque]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en la consulta: {str(e)}")
+    finally:
+        resultado.cerrar()
+    respuesta = respuesta_dataframe(pd.DataFrame.from_records(filas, columns=resultado.columnas), formato)
+    respuesta.headers["X-Truncado"] = "true" if resultado.truncado else "false"
+    return respuesta
 
 # Endpoint para obtener el esquema de la base de datos
 @app.get("/schema")
@@ -76,78 +202,240 @@ def get_schema():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener el esquema: {str(e)}")
 
-# Endpoint para exportar una tabla a CSV
+# Endpoint para consultar el estado del pool de conexiones compartido
+@app.get("/pool")
+def pool_estadisticas():
+    try:
+        return {"pool": estadisticas_pool()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener estadísticas del pool: {str(e)}")
+
+# Métricas en formato de Prometheus: peticiones y latencia por ruta, tiempo por fase
+# (db, dataframe, render, serializacion) y estado de los pools de conexiones y de gráficos
+@app.get("/metrics")
+def metrics():
+    texto = metricas.exportar(estadisticas_pool(), pool_graficos.estadisticas())
+    return Response(texto, media_type="text/plain; version=0.0.4")
+
+def _parsear_filtros(filtros):
+    """Convierte filtros 'columna:operador:valor' de la URL en tuplas"""
+    resultado = []
+    for filtro in filtros or []:
+        partes = filtro.split(":", 2)
+        if len(partes) != 3:
+            raise ValueError(f"Filtro inválido '{filtro}', se espera columna:operador:valor")
+        resultado.append(tuple(partes))
+    return resultado
+
+# Endpoint para exportar una tabla (CSV, Parquet, Arrow IPC o Feather)
+# Se envía en streaming (respuesta chunked) leyendo la tabla completa por bloques
 @app.get("/export/{table_name}")
-def export_to_csv(table_name: str):
+def exportar_tabla(table_name: str,
+                   formato: str = Query("csv", description="csv, parquet, arrow (IPC streaming), feather o html"),
+                   columnas: str = Query(None, description="Columnas a exportar separadas por comas (todas si se omite)"),
+                   filtro: List[str] = Query(None, description="Filtros columna:operador:valor, operador en eq, ne, lt, le, gt, ge"),
+                   gzip: bool = Query(False, description="Comprimir el CSV con gzip sobre la marcha"),
+                   filas_por_bloque: int = Query(FILAS_POR_BLOQUE, ge=1, le=100000, description="Filas leídas por bloque (en Parquet, filas por row group)")):
     try:
-        file_path = f"./exports/{table_name}.csv"
-        export_table_to_csv(table_name, file_path)
-        return {"message": f"Tabla {table_name} exportada a {file_path}"}
+        # Validamos antes de empezar a enviar: después ya no se puede responder con un error
+        lista_columnas = [c.strip() for c in columnas.split(",") if c.strip()] if columnas else None
+        filtros = _parsear_filtros(filtro)
+        construir_select_tabla(table_name, lista_columnas, filtros)
+        cabeceras = {}
+
+        if formato == "csv":
+            nombre_archivo = f"{table_name}.csv.gz" if gzip else f"{table_name}.csv"
+            contenido = stream_table_csv(table_name, filas_por_bloque, gzip, lista_columnas, filtros)
+            media_type = "application/gzip" if gzip else "text/csv"
+        elif formato in FORMATOS_COLUMNARES:
+            media_type, extension = FORMATOS_COLUMNARES[formato]
+            nombre_archivo = f"{table_name}.{extension}"
+            contenido = stream_table_columnar(table_name, formato, filas_por_bloque, lista_columnas, filtros)
+            # Ya van comprimidos por dentro (zstd o LZ4): GZipSelectivo no los vuelve a comprimir
+            cabeceras["Content-Encoding"] = "identity"
+        elif formato == "html":
+            # La tabla completa como página HTML: cada bloque del cursor se envía al leerlo
+            bloques = iterar_bloques_tabla(table_name, filas_por_bloque, lista_columnas, filtros)
+            contenido = stream_tabla_html(next(bloques), bloques, f"Tabla {table_name}")
+            return StreamingResponse(contenido, media_type="text/html")
+        else:
+            raise ValueError(f"Formato desconocido: {formato}")
+
+        return StreamingResponse(
+            metricas.iterar_medido("serializacion", contenido),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{nombre_archivo}"', **cabeceras},
+        )
+    except TablaNoEncontrada as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al exportar la tabla: {str(e)}")
 
+# ----- CACHÉ DE CONSULTAS -----
+
+# Estadísticas de la caché de resultados (aciertos, fallos, desalojos)
+@app.get("/cache")
+def cache_estadisticas():
+    return {"cache": cache_consultas.estadisticas(), "graficos": cache_graficos.estadisticas(),
+            "render_graficos": pool_graficos.estadisticas()}
+
+# Invalida la caché completa o solo las consultas que usan una tabla
+@app.post("/cache/invalidar")
+def cache_invalidar(tabla: str = Query(None, description="Tabla cuyas consultas se invalidan (todas si se omite)")):
+    eliminadas = invalidar_cache_consultas(tabla)
+    # Los gráficos llevan la versión de los datos en su clave, que acaba de cambiar;
+    # si se invalida todo, además liberamos la memoria que ocupaban
+    if tabla is None:
+        cache_graficos.invalidar()
+    return {"message": f"{eliminadas} consultas invalidadas", "cache": cache_consultas.estadisticas()}
+
+# Ejecuciones, errores, filas y tiempos de cada consulta del catálogo (consultas.py) y contadores de POST /query
+@app.get("/consultas")
+def consultas_estadisticas():
+    return {"consultas": consultas_mod.estadisticas_consultas(), "query": consulta_libre.estadisticas()}
+
+# Sentencias SQL agrupadas por endpoint (llamadas, filas y tiempos) y últimas consultas lentas
+@app.get("/consultas/perfil")
+def consultas_perfil(limite: int = Query(50, ge=1, le=1000, description="Sentencias a mostrar, las de más tiempo acumulado primero")):
+    return {"perfil": perfil_sql.estadisticas(limite)}
+
+# Borra las estadísticas del perfil SQL y las consultas lentas guardadas en memoria
+@app.post("/consultas/perfil/reiniciar")
+def consultas_perfil_reiniciar():
+    perfil_sql.reiniciar()
+    return {"message": "Perfil SQL reiniciado"}
+
+# ----- SNAPSHOT ANALÍTICO EN MEMORIA -----
+
+# Estado del snapshot: versión, filas y memoria ocupada
+@app.get("/snapshot")
+def snapshot_info():
+    return {"snapshot": info_snapshot()}
+
+# Recarga el snapshot desde la base de datos
+@app.post("/snapshot/refrescar")
+def snapshot_refrescar():
+    try:
+        refrescar_snapshot()
+        return {"snapshot": info_snapshot()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al refrescar el snapshot: {str(e)}")
+
+# Descarta el snapshot; se recarga en la siguiente consulta
+@app.post("/snapshot/invalidar")
+def snapshot_invalidar():
+    invalidar_snapshot()
+    return {"message": "Snapshot invalidado"}
+
+# ----- RESÚMENES INCREMENTALES -----
+
+# Estado de los contadores que usan /pandas/* y los gráficos de distribución
+@app.get("/resumenes")
+def resumenes_info():
+    return {"resumenes": info_resumenes()}
+
+# Aplica cambios de filas ya hechos en la base de datos a los contadores, sin recalcularlos.
+# Cuerpo: lista de {"tabla": "superhero" | "hero_power" | "hero_attribute", "anterior": {...}, "nueva": {...}}
+@app.post("/resumenes/cambios")
+def resumenes_cambios(cambios: List[dict]):
+    try:
+        return {"resumenes": aplicar_cambios(cambios)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al aplicar los cambios: {str(e)}")
+
+# ----- BÚSQUEDA DE NOMBRES -----
+
+# Autocompletado sobre nombres de héroes, nombres completos, poderes y editoriales
+# (índice de trigramas en memoria, busqueda.py). Devuelve JSON con los ids de cada coincidencia.
+@app.get("/buscar")
+async def buscar_nombres(q: str = Query(..., min_length=1, description="Texto a buscar"),
+                         campos: List[str] = Query(None, description="Campos: superhero_name, full_name, power_name, publisher_name (todos si se omite)"),
+                         limite: int = Query(10, ge=1, le=100, description="Cantidad máxima de resultados"),
+                         modo: str = Query("auto", description="auto, contiene, prefijo o difuso")):
+    try:
+        inicio = time.perf_counter()
+        resultados = await _en_memoria(busqueda_mod.indice_vigente, busqueda_mod.buscar, q, campos, limite, modo)
+        return {
+            "consulta": q,
+            "resultados": resultados,
+            "microsegundos": round((time.perf_counter() - inicio) * 1e6),
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en la búsqueda: {str(e)}")
+
+# Estado del índice de búsqueda: nombres y trigramas por campo
+@app.get("/buscar/indice")
+def buscar_indice():
+    return {"indice": busqueda_mod.info_busqueda()}
+
 # ----- ENDPOINTS PARA CONSULTAS PANDAS -----
 
 # TOP poderes más populares
 @app.get("/pandas/top-poderes")
-def top_poderes(top: int = Query(10, description="Cantidad de poderes a mostrar")):
+async def top_poderes(request: Request, top: int = Query(10, description="Cantidad de poderes a mostrar")):
     try:
-        df = pandas_mod.get_top_poderes_populares(top)
-        return tabla_formato(df, f"TOP {top} Poderes más Populares")
+        df = await _en_memoria(resumen_vigente, pandas_mod.get_top_poderes_populares, top)
+        return responder_tabla(df, f"TOP {top} Poderes más Populares", request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos: {str(e)}")
 
 # TOP atributos de héroes
 @app.get("/pandas/top-atributos")
-def top_atributos(top: int = Query(10, description="Cantidad de atributos a mostrar")):
+async def top_atributos(request: Request, top: int = Query(10, description="Cantidad de atributos a mostrar")):
     try:
-        df = pandas_mod.get_top_atributos_heroes(top)
-        return tabla_formato(df, f"TOP {top} Atributos más Comunes")
+        df = await _en_memoria(resumen_vigente, pandas_mod.get_top_atributos_heroes, top)
+        return responder_tabla(df, f"TOP {top} Atributos más Comunes", request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos: {str(e)}")
 
 # Distribución de géneros
 @app.get("/pandas/generos")
-def generos_distribucion():
+async def generos_distribucion(request: Request):
     try:
-        df = pandas_mod.get_generos_distribucion()
-        return tabla_formato(df, "Distribución de Superhéroes por Género")
+        df = await _en_memoria(resumen_vigente, pandas_mod.get_generos_distribucion)
+        return responder_tabla(df, "Distribución de Superhéroes por Género", request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos: {str(e)}")
 
 # Distribución de razas
 @app.get("/pandas/razas")
-def razas_distribucion():
+async def razas_distribucion(request: Request):
     try:
-        df = pandas_mod.get_razas_distribucion()
-        return tabla_formato(df, "Distribución de Superhéroes por Raza")
+        df = await _en_memoria(resumen_vigente, pandas_mod.get_razas_distribucion)
+        return responder_tabla(df, "Distribución de Superhéroes por Raza", request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos: {str(e)}")
 
 # TOP publishers
 @app.get("/pandas/top-publishers")
-def top_publishers(top: int = Query(10, description="Cantidad de editoriales a mostrar")):
+async def top_publishers(request: Request, top: int = Query(10, description="Cantidad de editoriales a mostrar")):
     try:
-        df = pandas_mod.get_top_publishers_heroes(top)
-        return tabla_formato(df, f"TOP {top} Editoriales con más Superhéroes")
+        df = await _en_memoria(resumen_vigente, pandas_mod.get_top_publishers_heroes, top)
+        return responder_tabla(df, f"TOP {top} Editoriales con más Superhéroes", request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos: {str(e)}")
 
 # TOP héroes por cantidad de poderes
 @app.get("/pandas/top-heroes-poderes")
-def top_heroes_poderes(top: int = Query(10, description="Cantidad de héroes a mostrar")):
+async def top_heroes_poderes(request: Request, top: int = Query(10, description="Cantidad de héroes a mostrar")):
     try:
-        df = pandas_mod.get_top_heroes_por_poderes(top)
-        return tabla_formato(df, f"TOP {top} Superhéroes con más Poderes")
+        df = await _en_memoria(resumen_vigente, pandas_mod.get_top_heroes_por_poderes, top)
+        return responder_tabla(df, f"TOP {top} Superhéroes con más Poderes", request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos: {str(e)}")
 
 # Distribución de alineaciones
 @app.get("/pandas/alineaciones")
-def alineaciones_distribucion():
+async def alineaciones_distribucion(request: Request):
     try:
-        df = pandas_mod.get_alineaciones_distribucion()
-        return tabla_formato(df, "Distribución de Superhéroes por Alineación")
+        df = await _en_memoria(resumen_vigente, pandas_mod.get_alineaciones_distribucion)
+        return responder_tabla(df, "Distribución de Superhéroes por Alineación", request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos: {str(e)}")
 
@@ -155,57 +443,79 @@ def alineaciones_distribucion():
 
 # Gráfico de TOP héroes por poderes
 @app.get("/seaborn/heroes-poderes-grafico")
-def heroes_poderes_grafico(top: int = Query(10, description="Cantidad de héroes a mostrar")):
+def heroes_poderes_grafico(request: Request, top: int = Query(10, description="Cantidad de héroes a mostrar")):
     try:
-        return seaborn_mod.get_top_heroes_por_poderes_grafico(top)
+        return seaborn_mod.grafico_cacheado(request, seaborn_mod.get_top_heroes_por_poderes_grafico, TOP=top)
+    except RenderSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar gráfico: {str(e)}")
 
 # Gráfico de distribución de alineaciones
 @app.get("/seaborn/alineaciones-grafico")
-def alineaciones_grafico():
+def alineaciones_grafico(request: Request):
     try:
-        return seaborn_mod.get_distribucion_alineaciones_grafico()
+        return seaborn_mod.grafico_cacheado(request, seaborn_mod.get_distribucion_alineaciones_grafico)
+    except RenderSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar gráfico: {str(e)}")
 
 # Gráfico de distribución de géneros
 @app.get("/seaborn/generos-grafico")
-def generos_grafico():
+def generos_grafico(request: Request):
     try:
-        return seaborn_mod.get_distribucion_generos_grafico()
+        return seaborn_mod.grafico_cacheado(request, seaborn_mod.get_distribucion_generos_grafico)
+    except RenderSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar gráfico: {str(e)}")
 
 # Gráfico de TOP poderes
 @app.get("/seaborn/poderes-grafico")
-def poderes_grafico(top: int = Query(10, description="Cantidad de poderes a mostrar")):
+def poderes_grafico(request: Request, top: int = Query(10, description="Cantidad de poderes a mostrar")):
     try:
-        return seaborn_mod.get_top_poderes_grafico(top)
+        return seaborn_mod.grafico_cacheado(request, seaborn_mod.get_top_poderes_grafico, TOP=top)
+    except RenderSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar gráfico: {str(e)}")
 
 # Gráfico de editoriales por alineación
 @app.get("/seaborn/publisher-alineacion-grafico")
-def publisher_alineacion_grafico(top: int = Query(10, description="Cantidad de editoriales a mostrar")):
+def publisher_alineacion_grafico(request: Request, top: int = Query(10, description="Cantidad de editoriales a mostrar")):
     try:
-        return seaborn_mod.get_publisher_por_alineacion_grafico(top)
+        return seaborn_mod.grafico_cacheado(request, seaborn_mod.get_publisher_por_alineacion_grafico, TOP=top)
+    except RenderSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar gráfico: {str(e)}")
 
 # Gráfico de características físicas
 @app.get("/seaborn/caracteristicas-grafico")
-def caracteristicas_grafico():
+def caracteristicas_grafico(request: Request):
     try:
-        return seaborn_mod.get_distribucion_caracteristicas_grafico()
+        return seaborn_mod.grafico_cacheado(request, seaborn_mod.get_distribucion_caracteristicas_grafico)
+    except RenderSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar gráfico: {str(e)}")
 
 # Gráfico de alturas y pesos
 @app.get("/seaborn/alturas-pesos-grafico")
-def alturas_pesos_grafico():
+def alturas_pesos_grafico(request: Request,
+                          formato: str = Query("png", description="png, svg o webp"),
+                          dpi: int = Query(100, ge=30, le=300, description="Resolución de la imagen"),
+                          ancho: int = Query(1200, ge=100, le=4000, description="Ancho en píxeles"),
+                          alto: int = Query(800, ge=100, le=3000, description="Alto en píxeles"),
+                          modo: str = Query("auto", description="auto, puntos o densidad (histograma 2D, automático con muchos héroes)")):
     try:
-        return seaborn_mod.get_alturas_pesos_superheroes_grafico()
+        return seaborn_mod.grafico_cacheado(request, seaborn_mod.get_alturas_pesos_superheroes_grafico,
+                                            formato=formato, dpi=dpi, ancho=ancho, alto=alto, modo=modo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RenderSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar gráfico: {str(e)}")
 
@@ -213,211 +523,118 @@ def alturas_pesos_grafico():
 
 # Consulta personalizada: TOP héroes con más de un tipo de poder específico
 @app.get("/sql/heroes-con-poder")
-def heroes_con_poder(poder: str = Query(..., description="Nombre del poder a buscar")):
-    try:
-        query = f"""
-        SELECT s.superhero_name as 'Superhéroe', 
-               COUNT(hp.power_id) as 'Cantidad de Poderes'
-        FROM superhero s
-        JOIN hero_power hp ON s.id = hp.hero_id
-        JOIN superpower sp ON hp.power_id = sp.id
-        WHERE sp.power_name LIKE '%{poder}%'
-        GROUP BY s.superhero_name
-        ORDER BY COUNT(hp.power_id) DESC
-        LIMIT 10
-        """
-        data = execute_query(query)
-        df = pd.DataFrame(data)
-        return tabla_formato(df, f"Superhéroes con poderes relacionados a '{poder}'")
+async def heroes_con_poder(request: Request, poder: str = Query(..., description="Nombre del poder a buscar")):
+    try:
+        # Los poderes que contienen el texto se resuelven con el índice de trigramas
+        # (busqueda.py) y la consulta filtra por sus ids en lugar de usar LIKE '%texto%'
+        ids = await _en_memoria(busqueda_mod.indice_vigente, busqueda_mod.ids_poderes, poder)
+        if not ids:
+            df = pd.DataFrame(columns=['Superhéroe', 'Cantidad de Poderes'])
+        else:
+            data = await consultas_mod.ejecutar_async("heroes_con_poder", {"ids": ids, "limite": 10})
+            df = pd.DataFrame(data)
+        return responder_tabla(df, f"Superhéroes con poderes relacionados a '{poder}'", request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en la consulta: {str(e)}")
 
 # Consulta personalizada: Comparativa de poderes entre dos superhéroes
 @app.get("/sql/comparar-heroes")
-def comparar_heroes(heroe1: str = Query(..., description="Nombre del primer superhéroe"),
-                   heroe2: str = Query(..., description="Nombre del segundo superhéroe")):
-    try:
-        query = f"""
-        SELECT sp.power_name as 'Poder',
-               MAX(CASE WHEN s.superhero_name = '{heroe1}' THEN 'Sí' ELSE 'No' END) as '{heroe1}',
-               MAX(CASE WHEN s.superhero_name = '{heroe2}' THEN 'Sí' ELSE 'No' END) as '{heroe2}'
-        FROM superpower sp
-        LEFT JOIN hero_power hp ON sp.id = hp.power_id
-        LEFT JOIN superhero s ON hp.hero_id = s.id AND s.superhero_name IN ('{heroe1}', '{heroe2}')
-        GROUP BY sp.power_name
-        HAVING MAX(CASE WHEN s.superhero_name = '{heroe1}' THEN 1 ELSE 0 END) = 1 OR
-               MAX(CASE WHEN s.superhero_name = '{heroe2}' THEN 1 ELSE 0 END) = 1
-        ORDER BY sp.power_name
-        """
-        data = execute_query(query)
-        df = pd.DataFrame(data)
-        return tabla_formato(df, f"Comparativa de poderes: {heroe1} vs {heroe2}")
+async def comparar_heroes(request: Request, heroe1: str = Query(..., description="Nombre del primer superhéroe"),
+                          heroe2: str = Query(..., description="Nombre del segundo superhéroe")):
+    try:
+        # Los nombres se resuelven a ids con el índice de búsqueda; la consulta solo
+        # lee las filas de hero_power de esos héroes
+        ids1 = await _en_memoria(busqueda_mod.indice_vigente, busqueda_mod.ids_heroes, heroe1)
+        ids2 = await _en_memoria(busqueda_mod.indice_vigente, busqueda_mod.ids_heroes, heroe2)
+        if not ids1 and not ids2:
+            df = pd.DataFrame(columns=['Poder', heroe1, heroe2])
+        else:
+            # Un IN vacío no es válido en todos los motores: se usa un id que no existe
+            params = {"ids1": ids1 or [-1], "ids2": ids2 or [-1], "ids": ids1 + ids2}
+            data = await consultas_mod.ejecutar_async("comparar_heroes", params)
+            df = pd.DataFrame(data).rename(columns={'heroe1': heroe1, 'heroe2': heroe2})
+        return responder_tabla(df, f"Comparativa de poderes: {heroe1} vs {heroe2}", request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en la consulta: {str(e)}")
 
 # Consulta personalizada: Análisis de atributos por género
 @app.get("/sql/atributos-por-genero")
-def atributos_por_genero():
-    try:
-        query = """
-        SELECT g.gender as 'Género',
-               a.attribute_name as 'Atributo',
-               COUNT(ha.hero_id) as 'Cantidad de Héroes'
-        FROM gender g
-        JOIN superhero s ON g.id = s.gender_id
-        JOIN hero_attribute ha ON s.id = ha.hero_id
-        JOIN attribute a ON ha.attribute_id = a.id
-        GROUP BY g.gender, a.attribute_name
-        ORDER BY g.gender, COUNT(ha.hero_id) DESC
-        """
-        data = execute_query(query)
+async def atributos_por_genero(request: Request):
+    try:
+        data = await consultas_mod.ejecutar_async("atributos_por_genero")
         df = pd.DataFrame(data)
-        return tabla_formato(df, "Análisis de Atributos por Género")
+        return responder_tabla(df, "Análisis de Atributos por Género", request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en la consulta: {str(e)}")
 
 # Consulta personalizada: Poderes más comunes por editorial
 @app.get("/sql/poderes-por-editorial")
-def poderes_por_editorial(editorial: str = Query(..., description="Nombre de la editorial")):
-    try:
-        query = f"""
-        SELECT sp.power_name as 'Poder',
-               COUNT(hp.hero_id) as 'Cantidad de Héroes'
-        FROM superpower sp
-        JOIN hero_power hp ON sp.id = hp.power_id
-        JOIN superhero s ON hp.hero_id = s.id
-        JOIN publisher p ON s.publisher_id = p.id
-        WHERE p.publisher_name LIKE '%{editorial}%'
-        GROUP BY sp.power_name
-        ORDER BY COUNT(hp.hero_id) DESC
-        LIMIT 15
-        """
-        data = execute_query(query)
-        df = pd.DataFrame(data)
-        return tabla_formato(df, f"Poderes más comunes en héroes de {editorial}")
+async def poderes_por_editorial(request: Request, editorial: str = Query(..., description="Nombre de la editorial")):
+    try:
+        # Las editoriales que contienen el texto se resuelven con el índice de trigramas
+        ids = await _en_memoria(busqueda_mod.indice_vigente, busqueda_mod.ids_editoriales, editorial)
+        if not ids:
+            df = pd.DataFrame(columns=['Poder', 'Cantidad de Héroes'])
+        else:
+            data = await consultas_mod.ejecutar_async("poderes_por_editorial", {"ids": ids, "limite": 15})
+            df = pd.DataFrame(data)
+        return responder_tabla(df, f"Poderes más comunes en héroes de {editorial}", request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en la consulta: {str(e)}")
 
 # Consulta personalizada: Distribución de características físicas por alineación
 @app.get("/sql/caracteristicas-por-alineacion")
-def caracteristicas_por_alineacion():
-    try:
-        query = """
-        SELECT a.alignment as 'Alineación',
-               'Color de ojos' as 'Característica',
-               c.colour as 'Color',
-               COUNT(s.id) as 'Cantidad'
-        FROM alignment a
-        JOIN superhero s ON a.id = s.alignment_id
-        JOIN colour c ON s.eye_colour_id = c.id
-        GROUP BY a.alignment, c.colour
-        
-        UNION ALL
-        
-        SELECT a.alignment as 'Alineación',
-               'Color de cabello' as 'Característica',
-               c.colour as 'Color',
-               COUNT(s.id) as 'Cantidad'
-        FROM alignment a
-        JOIN superhero s ON a.id = s.alignment_id
-        JOIN colour c ON s.hair_colour_id = c.id
-        GROUP BY a.alignment, c.colour
-        
-        UNION ALL
-        
-        SELECT a.alignment as 'Alineación',
-               'Color de piel' as 'Característica',
-               c.colour as 'Color',
-               COUNT(s.id) as 'Cantidad'
-        FROM alignment a
-        JOIN superhero s ON a.id = s.alignment_id
-        JOIN colour c ON s.skin_colour_id = c.id
-        GROUP BY a.alignment, c.colour
-        
-        ORDER BY 'Alineación', 'Característica', 'Cantidad' DESC
-        """
-        data = execute_query(query)
-        df = pd.DataFrame(data)
-        return tabla_formato(df, "Características Físicas por Alineación")
+async def caracteristicas_por_alineacion(request: Request):
+    try:
+        # Los tres GROUP BY del antiguo UNION ALL salen de un único cubo de conteos
+        # (alineación × ojos × cabello × piel) calculado sobre el snapshot (agregados.py)
+        df = await _en_memoria(_snapshot_cargado, agregados_mod.get_caracteristicas_por_alineacion)
+        return responder_tabla(df, "Características Físicas por Alineación", request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en la consulta: {str(e)}")
 
 # Consulta personalizada: Análisis de combos de poderes
 @app.get("/sql/combos-poderes")
-def combos_poderes(top: int = Query(10, description="Cantidad de combinaciones a mostrar")):
-    try:
-        query = f"""
-        SELECT
-            sp1.power_name as 'Poder 1',
-            sp2.power_name as 'Poder 2',
-            COUNT(*) as 'Frecuencia'
-        FROM
-            hero_power hp1
-        JOIN
-            hero_power hp2 ON hp1.hero_id = hp2.hero_id AND hp1.power_id < hp2.power_id
-        JOIN
-            superpower sp1 ON hp1.power_id = sp1.id
-        JOIN
-            superpower sp2 ON hp2.power_id = sp2.id
-        GROUP BY
-            sp1.power_name, sp2.power_name
-        ORDER BY
-            COUNT(*) DESC
-        LIMIT {top}
-        """
-        data = execute_query(query)
-        df = pd.DataFrame(data)
-        return tabla_formato(df, f"TOP {top} Combinaciones de Poderes")
+async def combos_poderes(request: Request, top: int = Query(10, description="Cantidad de combinaciones a mostrar")):
+    try:
+        # Se responde con la matriz de co-ocurrencia precalculada (coocurrencia.py)
+        # en lugar del self-join de hero_power
+        df = await _en_memoria(coocurrencia_mod.coocurrencia_vigente, coocurrencia_mod.get_top_combos_poderes, top)
+        return responder_tabla(df, f"TOP {top} Combinaciones de Poderes", request)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en la consulta: {str(e)}")
+
+# Consulta personalizada: Poderes que más aparecen junto a un poder dado
+@app.get("/sql/poderes-relacionados")
+async def poderes_relacionados(request: Request, poder: str = Query(..., description="Nombre exacto del poder"),
+                               top: int = Query(10, description="Cantidad de poderes a mostrar")):
+    try:
+        df = await _en_memoria(coocurrencia_mod.coocurrencia_vigente, coocurrencia_mod.get_poderes_relacionados, poder, top)
+        return responder_tabla(df, f"TOP {top} Poderes que más aparecen junto a '{poder}'", request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en la consulta: {str(e)}")
 
 # Consulta personalizada: Superhéroes con características similares
 @app.get("/sql/heroes-similares")
-def heroes_similares(heroe: str = Query(..., description="Nombre del superhéroe")):
-    try:
-        query = f"""
-        WITH hero_features AS (
-            SELECT
-                s.id,
-                s.superhero_name,
-                s.gender_id,
-                s.eye_colour_id,
-                s.hair_colour_id,
-                s.skin_colour_id,
-                s.race_id,
-                s.publisher_id,
-                s.alignment_id
-            FROM superhero s
-            WHERE s.superhero_name = '{heroe}'
-        )
-        
-        SELECT
-            s.superhero_name as 'Superhéroe',
-            (CASE WHEN s.gender_id = hf.gender_id THEN 1 ELSE 0 END +
-             CASE WHEN s.eye_colour_id = hf.eye_colour_id THEN 1 ELSE 0 END +
-             CASE WHEN s.hair_colour_id = hf.hair_colour_id THEN 1 ELSE 0 END +
-             CASE WHEN s.skin_colour_id = hf.skin_colour_id THEN 1 ELSE 0 END +
-             CASE WHEN s.race_id = hf.race_id THEN 1 ELSE 0 END +
-             CASE WHEN s.publisher_id = hf.publisher_id THEN 1 ELSE 0 END +
-             CASE WHEN s.alignment_id = hf.alignment_id THEN 1 ELSE 0 END) as 'Similitud'
-        FROM
-            superhero s, hero_features hf
-        WHERE
-            s.superhero_name <> '{heroe}'
-            AND (s.gender_id = hf.gender_id
-                OR s.eye_colour_id = hf.eye_colour_id
-                OR s.hair_colour_id = hf.hair_colour_id
-                OR s.skin_colour_id = hf.skin_colour_id
-                OR s.race_id = hf.race_id
-                OR s.publisher_id = hf.publisher_id
-                OR s.alignment_id = hf.alignment_id)
-        ORDER BY
-            'Similitud' DESC
-        LIMIT 10
-        """
-        data = execute_query(query)
-        df = pd.DataFrame(data)
-        return tabla_formato(df, f"Superhéroes similares a {heroe}")
+async def heroes_similares(request: Request, heroe: str = Query(..., description="Nombre del superhéroe"),
+                           top: int = Query(10, description="Cantidad de superhéroes a mostrar"),
+                           poderes: bool = Query(False, description="Incluir los poderes en común como criterio adicional")):
+    try:
+        # Motor vectorizado en memoria (similitud.py): compara las siete columnas
+        # categóricas contra todos los héroes y devuelve un ranking real
+        df = await _en_memoria(similitud_mod.motor_vigente, similitud_mod.get_heroes_similares, heroe, top, poderes)
+        return responder_tabla(df, f"Superhéroes similares a {heroe}", request)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en la consulta: {str(e)}")
+
+# Consulta personalizada: Superhéroes similares para varios héroes a la vez
+@app.get("/sql/heroes-similares-lote")
+async def heroes_similares_lote(request: Request, heroes: List[str] = Query(..., description="Nombres de los superhéroes"),
+                                top: int = Query(5, description="Cantidad de vecinos por superhéroe"),
+                                poderes: bool = Query(False, description="Incluir los poderes en común como criterio adicional")):
+    try:
+        df = await _en_memoria(similitud_mod.motor_vigente, similitud_mod.get_heroes_similares_lote, heroes, top, poderes)
+        return responder_tabla(df, f"Superhéroes similares a {', '.join(heroes)}", request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en la consulta: {str(e)}")
 
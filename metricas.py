@@ -0,0 +1,256 @@
+import contextvars
+import functools
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Métricas en formato de texto de Prometheus para /metrics.
+# Por ruta (la plantilla, /tables/{table_name}, no la URL) se cuentan las peticiones y se
+# arma un histograma de latencia. Además se mide por separado el tiempo de cada fase:
+# consultas a la base de datos (db), armado de DataFrames (dataframe), dibujo de gráficos
+# (render) y serialización de la respuesta (serializacion), en total y por ruta.
+# Medir cuesta dos perf_counter y un lock por bloque: no hay dependencias ni hilos extra.
+
+# Límites de los histogramas en segundos (las consultas en memoria tardan menos de 1 ms)
+LIMITES_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Ruta con la que se cuentan las peticiones que no coinciden con ningún endpoint
+SIN_RUTA = "sin_ruta"
+
+class Histograma:
+    """Conteos por intervalo, suma y cantidad de observaciones para cada combinación de etiquetas"""
+
+    def __init__(self, limites=LIMITES_SEGUNDOS):
+        self.limites = tuple(limites)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, etiquetas, valor):
+        # bisect_left: un valor igual al límite cuenta en ese intervalo (le = "menor o igual")
+        indice = bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                serie = self._series[etiquetas] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def series(self):
+        with self._lock:
+            return [(etiquetas, list(serie[0]), serie[1], serie[2]) for etiquetas, serie in self._series.items()]
+
+class Contador:
+    """Contador que solo sube, por combinación de etiquetas"""
+
+    def __init__(self):
+        self._valores = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def sumar(self, etiquetas, valor=1):
+        with self._lock:
+            self._valores[etiquetas] += valor
+
+    def series(self):
+        with self._lock:
+            return list(self._valores.items())
+
+peticiones = Contador()                  # (metodo, ruta, estado)
+duracion_peticiones = Histograma()       # (metodo, ruta)
+duracion_fases = Histograma()            # (fase,)
+segundos_fase_por_ruta = Contador()      # (ruta, fase)
+_en_curso = [0]
+_lock_en_curso = threading.Lock()
+
+# Tiempo acumulado por fase en la petición actual. Es un dict compartido: los hilos del
+# threadpool reciben una copia del contexto, pero apuntan al mismo dict.
+_fases_peticion = contextvars.ContextVar("fases_peticion", default=None)
+
+# Segundos de los bloques medidos dentro del bloque actual. Las fases no se solapan: si
+# armar un DataFrame obliga a cargar el snapshot, esa carga cuenta como db y no como dataframe.
+_anidados = contextvars.ContextVar("fases_anidadas", default=None)
+
+def fases_peticion():
+    """Segundos por fase acumulados en la petición en curso (None fuera de una petición)"""
+    return _fases_peticion.get()
+
+def registrar_fase(fase, segundos):
+    duracion_fases.observar((fase,), segundos)
+    acumulado = _fases_peticion.get()
+    if acumulado is not None:
+        acumulado[fase] = acumulado.get(fase, 0.0) + segundos
+
+def _empezar():
+    hijos = [0.0]
+    return _anidados.set(hijos), hijos, time.perf_counter()
+
+def _terminar(fase, token, hijos, inicio):
+    segundos = time.perf_counter() - inicio
+    _anidados.reset(token)
+    padre = _anidados.get()
+    if padre is not None:
+        padre[0] += segundos
+    registrar_fase(fase, segundos - hijos[0])
+
+@contextmanager
+def medir(fase):
+    """Mide el bloque como tiempo de la fase indicada (sin los bloques medidos dentro)"""
+    token, hijos, inicio = _empezar()
+    try:
+        yield
+    finally:
+        _terminar(fase, token, hijos, inicio)
+
+def medido(fase):
+    """Decorador: cada llamada a la función cuenta como tiempo de la fase"""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            token, hijos, inicio = _empezar()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                _terminar(fase, token, hijos, inicio)
+        return envoltura
+    return decorador
+
+def iterar_medido(fase, iterable):
+    """
+    Recorre un iterable midiendo solo lo que tarda en producir cada elemento
+    (no el tiempo que quien lo consume tarda en enviarlo)
+    """
+    iterador = iter(iterable)
+    while True:
+        token, hijos, inicio = _empezar()
+        try:
+            elemento = next(iterador)
+        except StopIteration:
+            return
+        finally:
+            _terminar(fase, token, hijos, inicio)
+        yield elemento
+
+class MedicionPeticiones:
+    """
+    Middleware ASGI que cuenta las peticiones y mide su duración hasta enviar el último
+    byte (incluido el streaming), etiquetadas con la plantilla de la ruta que respondió
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        estado = [500]
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+            await send(mensaje)
+
+        inicio = time.perf_counter()
+        token = _fases_peticion.set({})
+        with _lock_en_curso:
+            _en_curso[0] += 1
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            segundos = time.perf_counter() - inicio
+            with _lock_en_curso:
+                _en_curso[0] -= 1
+            # El router deja en el scope la ruta que coincidió
+            ruta = getattr(scope.get("route"), "path", None) or SIN_RUTA
+            metodo = scope["method"]
+            peticiones.sumar((metodo, ruta, str(estado[0])))
+            duracion_peticiones.observar((metodo, ruta), segundos)
+            for fase, segundos_fase in _fases_peticion.get().items():
+                segundos_fase_por_ruta.sumar((ruta, fase), segundos_fase)
+            _fases_peticion.reset(token)
+
+# ----- FORMATO DE TEXTO DE PROMETHEUS -----
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _etiquetas(nombres, valores, extra=None):
+    pares = list(zip(nombres, valores)) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + "}"
+
+def _numero(valor):
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+def _lineas_histograma(nombre, ayuda, nombres_etiquetas, histograma):
+    yield f"# HELP {nombre} {ayuda}"
+    yield f"# TYPE {nombre} histogram"
+    for etiquetas, conteos, suma, cantidad in sorted(histograma.series()):
+        acumulado = 0
+        for limite, conteo in zip(histograma.limites + (float("inf"),), conteos):
+            acumulado += conteo
+            le = "+Inf" if limite == float("inf") else _numero(limite)
+            yield f"{nombre}_bucket{_etiquetas(nombres_etiquetas, etiquetas, ('le', le))} {acumulado}"
+        yield f"{nombre}_sum{_etiquetas(nombres_etiquetas, etiquetas)} {_numero(suma)}"
+        yield f"{nombre}_count{_etiquetas(nombres_etiquetas, etiquetas)} {cantidad}"
+
+def _lineas_serie(nombre, tipo, ayuda, nombres_etiquetas, series):
+    yield f"# HELP {nombre} {ayuda}"
+    yield f"# TYPE {nombre} {tipo}"
+    for etiquetas, valor in sorted(series):
+        yield f"{nombre}{_etiquetas(nombres_etiquetas, etiquetas)} {_numero(valor)}"
+
+def _lineas_pool(estadisticas_pool):
+    """Gauges del pool de conexiones a partir de database.estadisticas_pool()"""
+    gauges = [
+        ("superhero_db_pool_size", "Conexiones permanentes del pool", "tamano"),
+        ("superhero_db_pool_checked_in", "Conexiones libres en el pool", "disponibles"),
+        ("superhero_db_pool_checked_out", "Conexiones en uso", "en_uso"),
+        ("superhero_db_pool_overflow", "Conexiones abiertas por encima del tamaño del pool", "overflow"),
+    ]
+    for nombre, ayuda, clave in gauges:
+        if clave in estadisticas_pool:
+            yield from _lineas_serie(nombre, "gauge", ayuda, (), [((), estadisticas_pool[clave])])
+    contadores = [
+        ("superhero_db_pool_waits_total", "Veces que hubo que esperar una conexión libre", "esperas", 1),
+        ("superhero_db_pool_wait_seconds_total", "Tiempo total esperando una conexión libre", "espera_total_ms", 0.001),
+        ("superhero_db_pool_timeouts_total", "Esperas de conexión que terminaron en timeout", "timeouts", 1),
+    ]
+    for nombre, ayuda, clave, escala in contadores:
+        if clave in estadisticas_pool:
+            yield from _lineas_serie(nombre, "counter", ayuda, (), [((), estadisticas_pool[clave] * escala)])
+
+def _lineas_render(estadisticas_render):
+    yield from _lineas_serie("superhero_chart_render_in_progress", "gauge",
+                             "Gráficos dibujándose o en cola", (), [((), estadisticas_render["en_curso"])])
+    yield from _lineas_serie("superhero_chart_render_queue_limit", "gauge",
+                             "Gráficos en cola a partir de los cuales se responde 503", (), [((), estadisticas_render["max_cola"])])
+    yield from _lineas_serie("superhero_chart_render_rejected_total", "counter",
+                             "Gráficos rechazados por cola llena", (), [((), estadisticas_render["rechazados"])])
+
+def exportar(estadisticas_pool=None, estadisticas_render=None):
+    """Todas las métricas en el formato de texto de Prometheus (versión 0.0.4)"""
+    lineas = []
+    lineas.extend(_lineas_serie("superhero_http_requests_total", "counter", "Peticiones HTTP por ruta y estado",
+                                ("method", "route", "status"), peticiones.series()))
+    lineas.extend(_lineas_histograma("superhero_http_request_duration_seconds",
+                                     "Duración de las peticiones hasta el último byte enviado",
+                                     ("method", "route"), duracion_peticiones))
+    lineas.extend(_lineas_serie("superhero_http_requests_in_progress", "gauge", "Peticiones en curso",
+                                (), [((), _en_curso[0])]))
+    lineas.extend(_lineas_histograma("superhero_phase_duration_seconds",
+                                     "Duración de cada bloque medido: db, dataframe, render o serializacion",
+                                     ("phase",), duracion_fases))
+    lineas.extend(_lineas_serie("superhero_route_phase_seconds_total", "counter",
+                                "Tiempo total de cada fase dentro de las peticiones de cada ruta",
+                                ("route", "phase"), segundos_fase_por_ruta.series()))
+    if estadisticas_pool:
+        lineas.extend(_lineas_pool(estadisticas_pool))
+    if estadisticas_render:
+        lineas.extend(_lineas_render(estadisticas_render))
+    return "\n".join(lineas) + "\n"
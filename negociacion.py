@@ -0,0 +1,189 @@
+import csv
+import decimal
+import io
+import math
+
+import numpy as np
+import orjson
+import pandas as pd
+from fastapi.responses import Response
+
+from formato import tabla_formato
+from metricas import medido, iterar_medido
+
+# Negociación de contenido para los endpoints que devuelven tablas.
+# El formato se elige con la cabecera Accept (JSON, CSV, Arrow IPC o HTML) y se serializa
+# directamente desde el DataFrame, columna por columna: los arrays numéricos van tal cual
+# a orjson, y CSV y Arrow salen de pandas y pyarrow, sin armar un diccionario por fila.
+# La compresión gzip la agrega compresion.py cuando el cliente la acepta.
+
+# Formato -> tipo MIME
+TIPOS_MIME = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "html": "text/html",
+}
+
+_OPCIONES_JSON = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def _parsear_accept(cabecera):
+    """Lista de (tipo, subtipo, q) de una cabecera Accept"""
+    rangos = []
+    for parte in cabecera.split(","):
+        tipo, *parametros = [p.strip() for p in parte.split(";")]
+        if "/" not in tipo:
+            continue
+        q = 1.0
+        for parametro in parametros:
+            nombre, _, valor = parametro.partition("=")
+            if nombre.strip().lower() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        principal, _, subtipo = tipo.lower().partition("/")
+        rangos.append((principal, subtipo, q))
+    return rangos
+
+def elegir_formato(request, disponibles, defecto):
+    """
+    Formato de respuesta según la cabecera Accept, entre los disponibles.
+    Gana el de mayor q; a igual q, el rango más específico y después el orden de
+    disponibles (defecto primero). Sin Accept, o si no pide ninguno de los disponibles,
+    se responde con el formato por defecto.
+    """
+    rangos = _parsear_accept(request.headers.get("accept", ""))
+    if not rangos:
+        return defecto
+    candidatos = [defecto] + [f for f in disponibles if f != defecto]
+    mejor, mejor_clave = defecto, None
+    for orden, formato in enumerate(candidatos):
+        principal, _, subtipo = TIPOS_MIME[formato].partition("/")
+        # (q, especificidad) del rango más específico que cubre este tipo
+        coincidencias = [(q, 2 if r_sub == subtipo else 1 if r_principal == principal else 0)
+                         for r_principal, r_sub, q in rangos
+                         if (r_principal, r_sub) in ((principal, subtipo), (principal, "*"), ("*", "*"))]
+        if not coincidencias:
+            continue
+        q, especificidad = max(coincidencias, key=lambda c: c[1])
+        if q <= 0:
+            continue
+        clave = (q, especificidad, -orden)
+        if mejor_clave is None or clave > mejor_clave:
+            mejor, mejor_clave = formato, clave
+    return mejor
+
+# ----- SERIALIZADORES -----
+
+def _por_defecto(valor):
+    """Valores que orjson no conoce (Decimal de MySQL, NA de pandas, etc.)"""
+    if isinstance(valor, decimal.Decimal):
+        # Igual que el codificador de FastAPI: entero si no tiene decimales
+        return int(valor) if valor.as_tuple().exponent >= 0 else float(valor)
+    if valor is pd.NA or valor is pd.NaT:
+        return None
+    if isinstance(valor, (bytes, bytearray)):
+        return valor.decode("utf-8", errors="replace")
+    return str(valor)
+
+@medido("serializacion")
+def a_json(contenido):
+    """Serializa con orjson (arrays y escalares de NumPy incluidos)"""
+    return orjson.dumps(contenido, default=_por_defecto, option=_OPCIONES_JSON)
+
+def _columna_json(serie):
+    """Valores de una columna listos para orjson: arrays numéricos sin copiar a objetos de Python"""
+    if isinstance(serie.dtype, np.dtype) and serie.dtype.kind in "iufb":
+        # orjson escribe NaN como null
+        return np.ascontiguousarray(serie.to_numpy())
+    valores = serie.to_numpy(dtype=object)
+    if serie.hasnans:
+        valores = np.where(pd.isna(valores), None, valores)
+    return valores.tolist()
+
+def dataframe_json(df, **extra):
+    """JSON por columnas: {..extra, "columnas": [...], "datos": {columna: [valores]}, "filas": n}"""
+    return orjson.dumps({
+        **extra,
+        "columnas": [str(c) for c in df.columns],
+        "datos": {str(c): _columna_json(df.iloc[:, i]) for i, c in enumerate(df.columns)},
+        "filas": len(df),
+    }, default=_por_defecto, option=_OPCIONES_JSON)
+
+def dataframe_csv(df):
+    return df.to_csv(index=False).encode("utf-8")
+
+def dataframe_arrow(df):
+    """Arrow IPC en streaming (sin compresión interna: la comprime gzip si el cliente la acepta)"""
+    import pyarrow as pa
+
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    destino = io.BytesIO()
+    with pa.ipc.new_stream(destino, tabla.schema) as escritor:
+        escritor.write_table(tabla)
+    return destino.getvalue()
+
+def filas_ndjson(nombres, filas):
+    """Una fila JSON por línea"""
+    return iterar_medido("serializacion",
+                         (orjson.dumps(dict(zip(nombres, fila)), default=_por_defecto, option=_OPCIONES_JSON) + b"\n"
+                          for fila in filas))
+
+def bloques_json(clave, nombres, bloques, pie):
+    """
+    Objeto JSON en streaming: {clave: [filas como objetos], ...pie()}. Las filas llegan por
+    bloques (listas de tuplas) y pie() se llama al final, cuando ya se recorrieron todas.
+    """
+    def generar():
+        yield b'{' + orjson.dumps(clave) + b':['
+        separador = b""
+        for filas in bloques:
+            if filas:
+                yield separador + b",".join(orjson.dumps(dict(zip(nombres, fila)), default=_por_defecto, option=_OPCIONES_JSON)
+                                            for fila in filas)
+                separador = b","
+        # El pie es un objeto: se le quita la llave de apertura para continuar el anterior
+        yield b"]," + orjson.dumps(pie(), default=_por_defecto, option=_OPCIONES_JSON)[1:]
+    return iterar_medido("serializacion", generar())
+
+@medido("serializacion")
+def filas_csv(nombres, filas):
+    """CSV de filas (tuplas) de un cursor"""
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(nombres)
+    escritor.writerows(("" if v is None or (isinstance(v, float) and math.isnan(v)) else v for v in fila)
+                       for fila in filas)
+    return salida.getvalue().encode("utf-8")
+
+# ----- RESPUESTAS -----
+
+def _con_vary(respuesta):
+    # La respuesta depende de Accept: las cachés intermedias tienen que distinguirla
+    respuesta.headers.add_vary_header("Accept")
+    return respuesta
+
+@medido("serializacion")
+def respuesta_dataframe(df, formato, **extra):
+    """Respuesta con el DataFrame en json, csv o arrow (extra solo se agrega al JSON)"""
+    if formato == "json":
+        contenido = dataframe_json(df, **extra)
+    elif formato == "csv":
+        contenido = dataframe_csv(df)
+    elif formato == "arrow":
+        contenido = dataframe_arrow(df)
+    else:
+        raise ValueError(f"Formato desconocido: {formato}")
+    return _con_vary(Response(contenido, media_type=TIPOS_MIME[formato]))
+
+def responder_tabla(df, titulo, request):
+    """
+    Respuesta de los endpoints /pandas/* y /sql/*: HTML (tabla_formato) por defecto,
+    o JSON, CSV o Arrow si la cabecera Accept los pide
+    """
+    formato = elegir_formato(request, ("html", "json", "csv", "arrow"), "html")
+    if formato == "html":
+        return _con_vary(tabla_formato(df, titulo, request))
+    return respuesta_dataframe(df, formato, titulo=titulo)
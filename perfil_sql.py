@@ -0,0 +1,214 @@
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from entorno import env_float
+from metricas import fases_peticion
+
+# Perfil de las sentencias SQL que llegan al driver, con los eventos de cursor de SQLAlchemy.
+# Cada engine creado con database.crear_engine (y el asíncrono de database_async.py) queda
+# instrumentado: de cada sentencia se guarda la duración, las filas (rowcount del driver) y el
+# endpoint que la disparó. Con eso:
+# - /consultas/perfil agrupa las sentencias por endpoint, con llamadas, tiempo total y máximo;
+# - las que superan SLOW_QUERY_MS van al log de consultas lentas con sus parámetros
+#   (en consola, en /consultas/perfil y, si se define SLOW_QUERY_LOG, en ese archivo JSONL);
+# - cada respuesta lleva una cabecera Server-Timing con la cantidad de consultas y su tiempo
+#   total, más el tiempo de cada fase de metricas.py, visible en las herramientas del navegador.
+
+# Milisegundos a partir de los cuales una sentencia se considera lenta
+UMBRAL_LENTA_MS = env_float("SLOW_QUERY_MS", 200.0)
+
+# Archivo JSONL donde se agregan las consultas lentas (solo consola y memoria si no se define)
+ARCHIVO_LENTAS = os.getenv("SLOW_QUERY_LOG")
+
+# Consultas lentas que se conservan en memoria y sentencias distintas por las que se agrupa
+MAX_LENTAS = 100
+MAX_SENTENCIAS = 500
+
+# Largo máximo de los parámetros en el log (una lista de ids puede ser muy larga)
+MAX_CARACTERES_PARAMETROS = 1000
+
+# Endpoint con el que se registran las sentencias fuera de una petición (arranque, snapshot, CLI)
+SIN_PETICION = "sin_peticion"
+
+# Consultas y segundos de la petición en curso, más su scope para saber qué endpoint la atiende.
+# Igual que en metricas.py, los hilos del threadpool comparten el mismo dict.
+_peticion = contextvars.ContextVar("perfil_sql_peticion", default=None)
+
+# Listas de parámetros expandidas (IN (?, ?, ?), VALUES (%s, %s)): cuentan como la misma sentencia
+_LISTA_PARAMETROS = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+
+_lock = threading.Lock()
+_sentencias = {}
+_lentas = deque(maxlen=MAX_LENTAS)
+_totales = {"sentencias": 0, "segundos": 0.0, "errores": 0, "lentas": 0}
+
+def normalizar(sentencia):
+    """Sentencia en una sola línea, con las listas de parámetros colapsadas"""
+    return _LISTA_PARAMETROS.sub("(...)", " ".join(sentencia.split()))
+
+def endpoint_actual():
+    """Método y plantilla de la ruta que atiende la petición en curso"""
+    peticion = _peticion.get()
+    if peticion is None:
+        return SIN_PETICION
+    scope = peticion["scope"]
+    # El router guarda la ruta en el mismo scope al resolverla, antes de llamar al handler
+    ruta = getattr(scope.get("route"), "path", None) or scope.get("path", "")
+    return f"{scope.get('method', '')} {ruta}"
+
+def _parametros_texto(parametros):
+    texto = repr(parametros)
+    if len(texto) > MAX_CARACTERES_PARAMETROS:
+        texto = texto[:MAX_CARACTERES_PARAMETROS] + "..."
+    return texto
+
+def _registrar_lenta(endpoint, sentencia, parametros, segundos, filas, error):
+    entrada = {
+        "momento": datetime.now().isoformat(timespec="seconds"),
+        "endpoint": endpoint,
+        "ms": round(segundos * 1000, 3),
+        "filas": filas,
+        "error": error,
+        "sentencia": " ".join(sentencia.split()),
+        "parametros": _parametros_texto(parametros),
+    }
+    with _lock:
+        _lentas.append(entrada)
+        _totales["lentas"] += 1
+    print(f"🐢 Consulta lenta ({entrada['ms']} ms) en {endpoint}: {entrada['sentencia']} -- {entrada['parametros']}")
+    if ARCHIVO_LENTAS:
+        try:
+            with open(ARCHIVO_LENTAS, "a", encoding="utf-8") as archivo:
+                archivo.write(json.dumps(entrada, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"⚠️ No se pudo escribir en {ARCHIVO_LENTAS}: {e}")
+
+def registrar(sentencia, parametros, segundos, filas=None, error=False, varias=False):
+    """
+    Registra una sentencia ejecutada: en la petición en curso, en las estadísticas por
+    endpoint y, si supera el umbral, en el log de consultas lentas. Los executemany (varias)
+    no van al log: sus parámetros son lotes enteros de filas de una carga masiva.
+    """
+    peticion = _peticion.get()
+    if peticion is not None:
+        peticion["consultas"] += 1
+        peticion["segundos"] += segundos
+    endpoint = endpoint_actual()
+    clave = (endpoint, normalizar(sentencia))
+    with _lock:
+        _totales["sentencias"] += 1
+        _totales["segundos"] += segundos
+        _totales["errores"] += int(error)
+        entrada = _sentencias.get(clave)
+        if entrada is None:
+            if len(_sentencias) >= MAX_SENTENCIAS:
+                clave = (endpoint, "(otras sentencias)")
+                entrada = _sentencias.get(clave)
+            if entrada is None:
+                entrada = _sentencias[clave] = {"llamadas": 0, "errores": 0, "filas": 0,
+                                                "segundos_total": 0.0, "segundos_max": 0.0}
+        entrada["llamadas"] += 1
+        entrada["errores"] += int(error)
+        entrada["filas"] += filas or 0
+        entrada["segundos_total"] += segundos
+        entrada["segundos_max"] = max(entrada["segundos_max"], segundos)
+    if segundos * 1000 >= UMBRAL_LENTA_MS and not varias:
+        _registrar_lenta(endpoint, sentencia, parametros, segundos, filas, error)
+
+# ----- EVENTOS DE SQLALCHEMY -----
+
+def _antes(conn, cursor, sentencia, parametros, contexto, varias):
+    if contexto is not None:
+        contexto._inicio_perfil = time.perf_counter()
+
+def _despues(conn, cursor, sentencia, parametros, contexto, varias):
+    inicio = getattr(contexto, "_inicio_perfil", None)
+    if inicio is None:
+        return
+    # rowcount: filas afectadas, o leídas si el driver lo sabe (pymysql sí; sqlite3 da -1 en SELECT)
+    filas = getattr(cursor, "rowcount", -1)
+    registrar(sentencia, parametros, time.perf_counter() - inicio, filas if filas >= 0 else None, varias=varias)
+
+def _error(contexto_excepcion):
+    contexto = contexto_excepcion.execution_context
+    inicio = getattr(contexto, "_inicio_perfil", None)
+    if inicio is None or contexto_excepcion.statement is None:
+        return
+    registrar(contexto_excepcion.statement, contexto_excepcion.parameters, time.perf_counter() - inicio,
+              error=True, varias=bool(contexto and contexto.executemany))
+
+def instrumentar(engine):
+    """Agrega los eventos de perfil a un engine (síncrono o el sync_engine de uno asíncrono)"""
+    if not event.contains(engine, "before_cursor_execute", _antes):
+        event.listen(engine, "before_cursor_execute", _antes)
+        event.listen(engine, "after_cursor_execute", _despues)
+        event.listen(engine, "handle_error", _error)
+    return engine
+
+# ----- PETICIONES -----
+
+def _server_timing(peticion):
+    partes = [f'sql;desc="{peticion["consultas"]} consultas";dur={peticion["segundos"] * 1000:.3f}']
+    for fase, segundos in sorted((fases_peticion() or {}).items()):
+        partes.append(f"{fase};dur={segundos * 1000:.3f}")
+    return ", ".join(partes)
+
+class PerfilPeticiones:
+    """
+    Middleware ASGI que acumula las sentencias de cada petición y agrega la cabecera
+    Server-Timing. En las respuestas en streaming la cabecera sale con el primer trozo,
+    así que solo cuenta las consultas hechas hasta ese momento.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        peticion = {"consultas": 0, "segundos": 0.0, "scope": scope}
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                MutableHeaders(scope=mensaje).append("Server-Timing", _server_timing(peticion))
+            await send(mensaje)
+
+        token = _peticion.set(peticion)
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _peticion.reset(token)
+
+def estadisticas(limite=50):
+    """Totales, las sentencias con más tiempo acumulado por endpoint y las últimas consultas lentas"""
+    with _lock:
+        sentencias = [{"endpoint": endpoint, "sentencia": sentencia, **datos}
+                      for (endpoint, sentencia), datos in _sentencias.items()]
+        lentas = list(_lentas)
+        totales = dict(_totales)
+    sentencias.sort(key=lambda s: s["segundos_total"], reverse=True)
+    for s in sentencias:
+        s["ms_promedio"] = round(s["segundos_total"] * 1000 / s["llamadas"], 3)
+        s["segundos_total"] = round(s["segundos_total"], 6)
+        s["segundos_max"] = round(s["segundos_max"], 6)
+    totales["segundos"] = round(totales["segundos"], 6)
+    return {"umbral_lenta_ms": UMBRAL_LENTA_MS, "archivo_lentas": ARCHIVO_LENTAS, "totales": totales,
+            "sentencias_distintas": len(sentencias), "sentencias": sentencias[:limite],
+            "lentas": lentas[::-1]}
+
+def reiniciar():
+    """Borra las estadísticas y el log de consultas lentas en memoria"""
+    with _lock:
+        _sentencias.clear()
+        _lentas.clear()
+        _totales.update(sentencias=0, segundos=0.0, errores=0, lentas=0)
@@ -0,0 +1,164 @@
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as TimeoutFuturo
+from concurrent.futures.process import BrokenProcessPool
+
+from entorno import env_int
+from metricas import medido
+
+# Pool de procesos para dibujar los gráficos de seaborn_consultas.py.
+# Las consultas se hacen en el proceso de la API; los workers solo reciben el
+# DataFrame ya calculado y devuelven los bytes de la imagen. Así el dibujo (que es
+# CPU y retiene el GIL) no compite con los handlers, y cada worker tiene su propio
+# estado de matplotlib. La cola está acotada: si está llena se responde 503.
+
+class RenderSaturado(Exception):
+    """Hay demasiados gráficos en cola; el cliente debe reintentar más tarde"""
+
+def _iniciar_worker():
+    """Inicializa cada worker: backend Agg y las importaciones pesadas hechas de antemano"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import seaborn_consultas  # noqa: F401  (importa pandas, seaborn y matplotlib)
+
+def _calentar():
+    """Tarea vacía que obliga a cada worker a arrancar e importar todo"""
+    return os.getpid()
+
+class PoolGraficos:
+    """
+    Ejecuta funciones de dibujo en procesos separados con un límite de trabajos en curso.
+    Con workers=0 dibuja en el hilo que llama (útil en desarrollo o con un solo núcleo).
+    """
+
+    def __init__(self, workers=2, max_cola=8, timeout=30):
+        self.workers = workers
+        self.max_cola = max(max_cola, 1)
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._cupos = threading.BoundedSemaphore(self.max_cola)
+        self._en_curso = 0
+        self.renderizados = 0
+        self.rechazados = 0
+        self.errores = 0
+        self.timeouts = 0
+        self.segundos_total = 0.0
+
+    def iniciar(self):
+        """Arranca los procesos y espera a que estén calientes"""
+        if self.workers <= 0:
+            _iniciar_worker()
+            return
+        executor = self._executor_activo()
+        # Una tarea por worker: el pool crea los procesos a medida que recibe trabajo
+        for futuro in [executor.submit(_calentar) for _ in range(self.workers)]:
+            futuro.result()
+
+    def cerrar(self):
+        """Detiene los procesos"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _executor_activo(self):
+        with self._lock:
+            if self._executor is None:
+                contexto = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=contexto,
+                                                     initializer=_iniciar_worker)
+            return self._executor
+
+    def _reiniciar(self, executor):
+        """Descarta un pool roto (p. ej. un worker murió) para que el siguiente uso cree otro"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _terminar(self, inicio, correcto):
+        """Libera el cupo; solo los dibujos terminados bien cuentan para el tiempo medio"""
+        with self._lock:
+            self._en_curso -= 1
+            if correcto:
+                self.renderizados += 1
+                self.segundos_total += time.perf_counter() - inicio
+            else:
+                self.errores += 1
+        self._cupos.release()
+
+    def _al_terminar_futuro(self, inicio, futuro):
+        # El cupo se libera cuando el worker termina de verdad, no cuando el que espera se rinde:
+        # un gráfico que superó el timeout sigue ocupando el worker hasta acabar
+        if getattr(futuro, "vencido", False):
+            # Ya se contó como timeout: no suma a errores ni al tiempo medio
+            with self._lock:
+                self._en_curso -= 1
+            self._cupos.release()
+        else:
+            self._terminar(inicio, not futuro.cancelled() and futuro.exception() is None)
+
+    @medido("render")
+    def renderizar(self, dibujar, *args, **kwargs):
+        """Ejecuta dibujar(*args, **kwargs) en un worker y devuelve su resultado (los bytes de la imagen)"""
+        if not self._cupos.acquire(blocking=False):
+            with self._lock:
+                self.rechazados += 1
+            raise RenderSaturado(f"Hay {self.max_cola} gráficos en cola; reintenta en unos segundos")
+        with self._lock:
+            self._en_curso += 1
+        inicio = time.perf_counter()
+        if self.workers <= 0:
+            correcto = False
+            try:
+                resultado = dibujar(*args, **kwargs)
+                correcto = True
+                return resultado
+            finally:
+                self._terminar(inicio, correcto)
+        executor = self._executor_activo()
+        try:
+            futuro = executor.submit(dibujar, *args, **kwargs)
+        except BaseException as e:
+            self._terminar(inicio, False)
+            if isinstance(e, BrokenProcessPool):
+                self._reiniciar(executor)
+            raise
+        futuro.add_done_callback(functools.partial(self._al_terminar_futuro, inicio))
+        try:
+            return futuro.result(timeout=self.timeout)
+        except BrokenProcessPool:
+            self._reiniciar(executor)
+            raise
+        except TimeoutFuturo:
+            futuro.vencido = True
+            # Si todavía no empezó, se saca de la cola (el callback libera el cupo)
+            futuro.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"El gráfico tardó más de {self.timeout} s en dibujarse")
+
+    def estadisticas(self):
+        """Workers, trabajos en curso, rechazos por saturación y tiempo medio de dibujo"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_cola": self.max_cola,
+                "en_curso": self._en_curso,
+                "renderizados": self.renderizados,
+                "rechazados": self.rechazados,
+                "errores": self.errores,
+                "timeouts": self.timeouts,
+                "media_ms": round(self.segundos_total * 1000 / self.renderizados, 3) if self.renderizados else 0.0,
+            }
+
+_workers = env_int("CHART_WORKERS", 2)
+pool_graficos = PoolGraficos(
+    workers=_workers,
+    max_cola=env_int("CHART_QUEUE_MAX", max(_workers, 1) * 4),
+    timeout=env_int("CHART_RENDER_TIMEOUT", 30),
+)
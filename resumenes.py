@@ -0,0 +1,248 @@
+import threading
+import time
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+from snapshot import get_snapshot, snapshot_actual, REFERENCIAS_SUPERHERO
+from cache import marcar_datos_modificados
+
+# Resúmenes de conteos para los endpoints de distribución (pandas y seaborn).
+# Se construyen una vez a partir del snapshot y después se mantienen con deltas:
+# cada alta, baja o modificación de una fila de superhero, hero_power o hero_attribute
+# suma o resta 1 en los contadores afectados, sin volver a recorrer las tablas.
+# Leer una distribución cuesta O(grupos), no O(filas).
+#
+# Los contadores de las tablas de referencia se guardan por posición (la misma que usa
+# el snapshot) desplazada en 1: la casilla 0 acumula las filas con la clave NULL o
+# inexistente, que un JOIN descartaría. Los de héroes van por id, porque pueden
+# aparecer héroes nuevos que el snapshot todavía no conoce.
+
+# Tablas cuyos cambios se pueden aplicar como delta
+TABLAS_RESUMEN = ("superhero", "hero_power", "hero_attribute")
+
+def _desplazar(posiciones):
+    return np.asarray(posiciones, dtype=np.int64) + 1
+
+class ResumenConteos:
+    """Contadores por grupo mantenidos de forma incremental"""
+
+    def __init__(self, snapshot):
+        self.version = snapshot.version
+        self.referencias = snapshot.referencias
+        self._lock = threading.Lock()
+        inicio = time.perf_counter()
+
+        # superhero: una tabla de conteos por cada clave foránea + editorial × alineación
+        self.superhero = {
+            columna: np.bincount(_desplazar(snapshot.codigos_heroes[columna]),
+                                 minlength=len(self.referencias[tabla]) + 1)
+            for columna, tabla in REFERENCIAS_SUPERHERO.items()
+        }
+        self.editorial_alineacion = np.zeros((len(self.referencias["publisher"]) + 1,
+                                              len(self.referencias["alignment"]) + 1), dtype=np.int64)
+        np.add.at(self.editorial_alineacion, (_desplazar(snapshot.codigos_heroes["publisher_id"]),
+                                              _desplazar(snapshot.codigos_heroes["alignment_id"])), 1)
+
+        # hero_power: filas por poder (con hero_id) y filas por héroe (con power_id)
+        hero_power = snapshot.hero_power
+        self.poderes = np.bincount(_desplazar(hero_power["poder"][hero_power["hero_id"] >= 0]),
+                                   minlength=len(self.referencias["superpower"]) + 1)
+        ids, conteos = np.unique(hero_power["hero_id"][hero_power["power_id"] >= 0], return_counts=True)
+        self.poderes_por_heroe = Counter(dict(zip(ids.tolist(), conteos.tolist())))
+
+        # hero_attribute: filas por atributo (con hero_id)
+        hero_attribute = snapshot.hero_attribute
+        self.atributos = np.bincount(_desplazar(hero_attribute["atributo"][hero_attribute["hero_id"] >= 0]),
+                                     minlength=len(self.referencias["attribute"]) + 1)
+
+        # Nombre de cada héroe existente (el JOIN con superhero descarta los demás)
+        self.nombres_heroes = dict(zip(snapshot.heroes.ids.tolist(), np.asarray(snapshot.heroes.nombres, dtype=object)))
+        self.segundos_construccion = round(time.perf_counter() - inicio, 4)
+        self.cambios_aplicados = 0
+
+    # ----- DELTAS -----
+    # Cada cambio se traduce primero a una lista de incrementos (sin tocar los contadores);
+    # solo si todo el lote se pudo traducir se aplican los incrementos, juntos y bajo el lock.
+
+    @staticmethod
+    def _entero(fila, columna):
+        valor = fila.get(columna)
+        if valor is None:
+            return None
+        try:
+            return int(valor)
+        except (TypeError, ValueError):
+            raise ValueError(f"La columna '{columna}' tiene que ser un id entero (se recibió {valor!r})")
+
+    def _posicion(self, tabla, id_):
+        """Posición desplazada de un id en una tabla de referencia (0 si es NULL o no existe)"""
+        if id_ is None:
+            return 0
+        return int(self.referencias[tabla].codificar(np.array([id_], dtype=np.int64))[0]) + 1
+
+    def _superhero(self, fila, signo):
+        id_heroe = self._entero(fila, "id")
+        if id_heroe is None:
+            raise ValueError("Los cambios de superhero necesitan el id de la fila")
+        incrementos = [(self.superhero[columna], self._posicion(tabla, self._entero(fila, columna)), signo)
+                       for columna, tabla in REFERENCIAS_SUPERHERO.items()]
+        incrementos.append((self.editorial_alineacion,
+                            (self._posicion("publisher", self._entero(fila, "publisher_id")),
+                             self._posicion("alignment", self._entero(fila, "alignment_id"))), signo))
+        nombre = fila.get("superhero_name") if signo > 0 else None
+        incrementos.append((self.nombres_heroes, id_heroe, nombre))
+        return incrementos
+
+    def _hero_power(self, fila, signo):
+        id_heroe, id_poder = self._entero(fila, "hero_id"), self._entero(fila, "power_id")
+        incrementos = []
+        if id_heroe is not None:
+            incrementos.append((self.poderes, self._posicion("superpower", id_poder), signo))
+        if id_poder is not None:
+            incrementos.append((self.poderes_por_heroe, id_heroe, signo))
+        return incrementos
+
+    def _hero_attribute(self, fila, signo):
+        if self._entero(fila, "hero_id") is None:
+            return []
+        return [(self.atributos, self._posicion("attribute", self._entero(fila, "attribute_id")), signo)]
+
+    def _traducir(self, tabla, anterior, nueva):
+        """Incrementos (contador, clave, valor) de un cambio, o ValueError si el cambio no es válido"""
+        if tabla not in TABLAS_RESUMEN:
+            raise ValueError(f"La tabla '{tabla}' no tiene resúmenes incrementales")
+        if anterior is None and nueva is None:
+            raise ValueError("El cambio necesita la fila anterior, la nueva o ambas")
+        traducir_fila = getattr(self, f"_{tabla}")
+        incrementos = []
+        for fila, signo in ((anterior, -1), (nueva, +1)):
+            if fila is None:
+                continue
+            if not isinstance(fila, dict):
+                raise ValueError(f"Las filas de {tabla} tienen que ser objetos con sus columnas")
+            incrementos.extend(traducir_fila(fila, signo))
+        return incrementos
+
+    def aplicar_lote(self, cambios):
+        """
+        Aplica una lista de cambios (tabla, anterior, nueva): alta (solo nueva), baja (solo
+        anterior) o modificación (ambas). Si alguno no es válido no se aplica ninguno.
+        """
+        incrementos = [i for tabla, anterior, nueva in cambios for i in self._traducir(tabla, anterior, nueva)]
+        with self._lock:
+            for contador, clave, valor in incrementos:
+                if contador is self.nombres_heroes:
+                    # Alta o modificación: el nombre nuevo; baja: se quita el héroe
+                    if valor is None:
+                        contador.pop(clave, None)
+                    else:
+                        contador[clave] = valor
+                else:
+                    contador[clave] += valor
+            self.cambios_aplicados += len(cambios)
+
+    def aplicar(self, tabla, anterior=None, nueva=None):
+        """Aplica el cambio de una fila (ver aplicar_lote)"""
+        self.aplicar_lote([(tabla, anterior, nueva)])
+
+    # ----- LECTURAS -----
+
+    def _por_referencia(self, tabla, conteos):
+        """Serie nombre -> cantidad, ordenada de mayor a menor (sin la casilla de NULL)"""
+        with self._lock:
+            por_posicion = conteos[1:].copy()
+        return self.referencias[tabla].agrupar_por_nombre(por_posicion)
+
+    def distribucion_superhero(self, columna):
+        """Cantidad de superhéroes por nombre de la referencia (gender_id, race_id, ...)"""
+        return self._por_referencia(REFERENCIAS_SUPERHERO[columna], self.superhero[columna])
+
+    def distribucion_poderes(self):
+        """Cantidad de filas de hero_power por nombre de poder"""
+        return self._por_referencia("superpower", self.poderes)
+
+    def distribucion_atributos(self):
+        """Cantidad de filas de hero_attribute por nombre de atributo"""
+        return self._por_referencia("attribute", self.atributos)
+
+    def poderes_por_nombre_heroe(self):
+        """Cantidad de poderes por nombre de superhéroe, ordenada de mayor a menor"""
+        with self._lock:
+            pares = [(self.nombres_heroes[i], n) for i, n in self.poderes_por_heroe.items()
+                     if n > 0 and i in self.nombres_heroes]
+        if not pares:
+            return pd.Series([], dtype=np.int64)
+        nombres, conteos = zip(*pares)
+        # groupby ordena los nombres igual que las categorías del snapshot (para desempatar igual)
+        serie = pd.Series(conteos, index=pd.Index(nombres, dtype=object), dtype=np.int64).groupby(level=0).sum()
+        return serie.sort_values(ascending=False, kind="stable")
+
+    def editoriales_por_alineacion(self):
+        """DataFrame (publisher, alignment, hero_count) con los pares que tienen héroes"""
+        with self._lock:
+            matriz = self.editorial_alineacion[1:, 1:].copy()
+        editoriales, alineaciones = self.referencias["publisher"].nombres, self.referencias["alignment"].nombres
+        filas, columnas = np.nonzero(matriz > 0)
+        df = pd.DataFrame({
+            'publisher': np.asarray(editoriales, dtype=object)[filas],
+            'alignment': np.asarray(alineaciones, dtype=object)[columnas],
+            'hero_count': matriz[filas, columnas],
+        })
+        df = df.dropna(subset=['publisher', 'alignment'])
+        return df.groupby(['publisher', 'alignment'], as_index=False)['hero_count'].sum()
+
+    def info(self):
+        """Versión del snapshot de origen, cambios aplicados y memoria ocupada"""
+        with self._lock:
+            memoria = (sum(c.nbytes for c in self.superhero.values()) + self.editorial_alineacion.nbytes
+                       + self.poderes.nbytes + self.atributos.nbytes)
+            return {
+                "version_snapshot": self.version,
+                "segundos_construccion": self.segundos_construccion,
+                "cambios_aplicados": self.cambios_aplicados,
+                "heroes": len(self.nombres_heroes),
+                "memoria_bytes": int(memoria),
+            }
+
+_resumen = None
+_lock_resumen = threading.Lock()
+
+def get_resumen():
+    """Devuelve los resúmenes, reconstruyéndolos si el snapshot se recargó"""
+    snapshot = get_snapshot()
+    resumen = _resumen
+    if resumen is None or resumen.version != snapshot.version:
+        with _lock_resumen:
+            resumen = _actualizar(snapshot)
+    return resumen
+
+def _actualizar(snapshot):
+    global _resumen
+    if _resumen is None or _resumen.version != snapshot.version:
+        _resumen = ResumenConteos(snapshot)
+    return _resumen
+
+def resumen_vigente():
+    """Indica si los resúmenes ya están construidos para el snapshot actual (leerlos no toca la base de datos)"""
+    snapshot, resumen = snapshot_actual(), _resumen
+    return snapshot is not None and resumen is not None and resumen.version == snapshot.version
+
+def aplicar_cambios(cambios):
+    """
+    Aplica una lista de cambios {"tabla", "anterior", "nueva"} a los resúmenes.
+    Los gráficos cacheados dejan de usarse porque cambia la versión de los datos.
+    """
+    resumen = get_resumen()
+    # El lote se traduce completo antes de aplicar nada: un cambio inválido no deja el resto a medias
+    resumen.aplicar_lote([(cambio.get("tabla"), cambio.get("anterior"), cambio.get("nueva")) for cambio in cambios])
+    if cambios:
+        marcar_datos_modificados()
+    return resumen.info()
+
+def info_resumenes():
+    """Estado de los resúmenes sin forzar su construcción"""
+    resumen = _resumen
+    if resumen is None:
+        return {"construido": False}
+    return {"construido": True, **resumen.info()}
@@ -0,0 +1,160 @@
+import threading
+import numpy as np
+import pandas as pd
+
+from snapshot import get_snapshot, snapshot_actual, REFERENCIAS_SUPERHERO
+import busqueda
+from metricas import medido
+
+# Motor de similitud entre superhéroes para /sql/heroes-similares.
+# La consulta original comparaba las siete columnas categóricas con CASE WHEN en un
+# producto cruzado y ordenaba por el literal 'Similitud' (es decir, sin ordenar).
+# Aquí las siete columnas viven como una matriz de enteros y se puntúan todos los
+# héroes con una sola comparación vectorizada; el TOP-k sale de una selección parcial.
+
+# Héroes objetivo por bloque en el modo por lotes (limita la matriz objetivos×héroes)
+OBJETIVOS_POR_BLOQUE = 64
+
+class MotorSimilitud:
+    """Puntúa la similitud de todos los héroes frente a uno o varios héroes objetivo"""
+
+    def __init__(self, snapshot):
+        self.version = snapshot.version
+        self.ids = snapshot.heroes.ids
+        self.nombres = np.asarray(snapshot.heroes.nombres, dtype=object)
+        # Matriz héroes × 7 columnas con los códigos de gender, colores, race, publisher y alignment
+        self.caracteristicas = np.stack([snapshot.codigos_heroes[c] for c in REFERENCIAS_SUPERHERO], axis=1)
+
+        # En MySQL la comparación de nombres no distingue mayúsculas
+        self.nombres_normalizados = pd.Series(self.nombres).str.lower().to_numpy()
+
+        # Poderes de cada héroe, en CSR (héroe -> poderes) y CSC (poder -> héroes)
+        hero_power = snapshot.hero_power
+        validas = (hero_power["heroe"] >= 0) & (hero_power["poder"] >= 0)
+        pares = np.unique(np.stack([hero_power["heroe"][validas], hero_power["poder"][validas]], axis=1), axis=0)
+        n_heroes, n_poderes = len(self.nombres), len(snapshot.referencias["superpower"])
+        self.poderes_por_heroe = np.bincount(pares[:, 0], minlength=n_heroes)
+        self._heroe_indptr = np.concatenate(([0], np.cumsum(self.poderes_por_heroe)))
+        self._heroe_poderes = pares[:, 1]
+        orden = np.argsort(pares[:, 1], kind="stable")
+        self._poder_indptr = np.concatenate(([0], np.cumsum(np.bincount(pares[:, 1], minlength=n_poderes))))
+        self._poder_heroes = pares[orden, 0]
+
+    def posicion(self, nombre):
+        """Posición del primer héroe con ese nombre, o None (el nombre se resuelve con el índice de búsqueda)"""
+        ids = busqueda.ids_heroes(nombre)
+        if not ids:
+            return None
+        posicion = int(np.searchsorted(self.ids, ids[0]))
+        return posicion if posicion < len(self.ids) and self.ids[posicion] == ids[0] else None
+
+    def puntuar(self, posiciones):
+        """Similitud (0-7) de cada objetivo contra todos los héroes: matriz objetivos × héroes"""
+        objetivos = self.caracteristicas[posiciones]
+        puntuacion = np.zeros((len(objetivos), len(self.caracteristicas)), dtype=np.int8)
+        for columna in range(self.caracteristicas.shape[1]):
+            # NULL = NULL es falso en SQL: un código -1 nunca coincide
+            valores = np.where(objetivos[:, columna] >= 0, objetivos[:, columna], -2)
+            puntuacion += self.caracteristicas[None, :, columna] == valores[:, None]
+        return puntuacion
+
+    def poderes_en_comun(self, posicion):
+        """Cantidad de poderes que cada héroe comparte con el héroe dado"""
+        poderes = self._heroe_poderes[self._heroe_indptr[posicion]:self._heroe_indptr[posicion + 1]]
+        if len(poderes) == 0:
+            return np.zeros(len(self.nombres), dtype=np.int64)
+        heroes = np.concatenate([self._poder_heroes[self._poder_indptr[p]:self._poder_indptr[p + 1]] for p in poderes])
+        return np.bincount(heroes, minlength=len(self.nombres))
+
+    def _ranking(self, posicion, puntuacion, top, incluir_poderes):
+        """Ordena los candidatos de un objetivo y arma su DataFrame"""
+        candidatos = (puntuacion > 0) & (self.nombres_normalizados != self.nombres_normalizados[posicion])
+        orden_total = puntuacion.astype(np.float64)
+        if incluir_poderes:
+            comunes = self.poderes_en_comun(posicion)
+            union = self.poderes_por_heroe + self.poderes_por_heroe[posicion] - comunes
+            jaccard = np.divide(comunes, union, out=np.zeros(len(comunes)), where=union > 0)
+            # El Jaccard (0-1) desempata dentro de cada nivel de similitud
+            orden_total = orden_total + jaccard
+
+        indices = np.flatnonzero(candidatos)
+        valores = orden_total[indices]
+        if 0 < top < len(indices):
+            parcial = np.argpartition(-valores, top - 1)[:top]
+            indices, valores = indices[parcial], valores[parcial]
+        elif top <= 0:
+            indices, valores = indices[:0], valores[:0]
+        elegidos = indices[np.lexsort((indices, -valores))]
+
+        df = pd.DataFrame({
+            'Superhéroe': self.nombres[elegidos],
+            'Similitud': puntuacion[elegidos].astype(np.int64),
+        })
+        if incluir_poderes:
+            df['Poderes en común'] = comunes[elegidos]
+            df['Jaccard poderes'] = np.round(jaccard[elegidos], 3)
+        return df
+
+    def similares(self, posicion, top=10, incluir_poderes=False):
+        """Los TOP héroes más parecidos a un héroe"""
+        puntuacion = self.puntuar([posicion])[0]
+        return self._ranking(posicion, puntuacion, top, incluir_poderes)
+
+    def similares_lote(self, posiciones, top=10, incluir_poderes=False):
+        """Los TOP vecinos de varios héroes a la vez, en un único DataFrame"""
+        tablas = []
+        for inicio in range(0, len(posiciones), OBJETIVOS_POR_BLOQUE):
+            bloque = posiciones[inicio:inicio + OBJETIVOS_POR_BLOQUE]
+            puntuaciones = self.puntuar(bloque)
+            for posicion, puntuacion in zip(bloque, puntuaciones):
+                df = self._ranking(posicion, puntuacion, top, incluir_poderes)
+                df.insert(0, 'Héroe', self.nombres[posicion])
+                tablas.append(df)
+        if not tablas:
+            return pd.DataFrame(columns=['Héroe', 'Superhéroe', 'Similitud'])
+        return pd.concat(tablas, ignore_index=True)
+
+_motor = None
+_lock_motor = threading.Lock()
+
+def get_motor_similitud():
+    """Devuelve el motor de la versión actual del snapshot, reconstruyéndolo si los datos cambiaron"""
+    snapshot = get_snapshot()
+    motor = _motor
+    if motor is None or motor.version != snapshot.version:
+        with _lock_motor:
+            motor = _actualizar(snapshot)
+    return motor
+
+def motor_vigente():
+    """Indica si el motor ya está construido para el snapshot actual (usarlo no toca la base de datos)"""
+    snapshot, motor = snapshot_actual(), _motor
+    return (snapshot is not None and motor is not None and motor.version == snapshot.version
+            and busqueda.indice_vigente())
+
+def _actualizar(snapshot):
+    global _motor
+    if _motor is None or _motor.version != snapshot.version:
+        _motor = MotorSimilitud(snapshot)
+    return _motor
+
+@medido("dataframe")
+def get_heroes_similares(heroe, TOP=10, incluir_poderes=False):
+    """
+    Obtiene los TOP superhéroes con más características en común con un superhéroe
+    """
+    motor = get_motor_similitud()
+    posicion = motor.posicion(heroe)
+    if posicion is None:
+        return pd.DataFrame(columns=['Superhéroe', 'Similitud'])
+    return motor.similares(posicion, TOP, incluir_poderes)
+
+@medido("dataframe")
+def get_heroes_similares_lote(heroes, TOP=10, incluir_poderes=False):
+    """
+    Obtiene los TOP vecinos de varios superhéroes en una sola llamada
+    (los nombres que no existen se ignoran)
+    """
+    motor = get_motor_similitud()
+    posiciones = [p for p in (motor.posicion(h) for h in heroes) if p is not None]
+    return motor.similares_lote(posiciones, TOP, incluir_poderes)
@@ -0,0 +1,214 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from database import get_engine
+from cache import marcar_datos_modificados
+from metricas import medir
+
+# Snapshot analítico en memoria para las consultas de pandas_consultas.py.
+# Los datos son pequeños y casi de solo lectura, así que en lugar de mandar un
+# GROUP BY/JOIN a MySQL en cada petición cargamos las tablas una vez, con las
+# claves foráneas convertidas a códigos enteros, y contamos con NumPy.
+
+# Tablas de referencia: tabla -> columna con el nombre a mostrar
+TABLAS_REFERENCIA = {
+    "gender": "gender",
+    "colour": "colour",
+    "race": "race",
+    "alignment": "alignment",
+    "publisher": "publisher_name",
+    "attribute": "attribute_name",
+    "superpower": "power_name",
+}
+
+# Columnas categóricas de superhero -> tabla de referencia a la que apuntan
+REFERENCIAS_SUPERHERO = {
+    "gender_id": "gender",
+    "eye_colour_id": "colour",
+    "hair_colour_id": "colour",
+    "skin_colour_id": "colour",
+    "race_id": "race",
+    "publisher_id": "publisher",
+    "alignment_id": "alignment",
+}
+
+def _ids_enteros(columna):
+    """Convierte una columna de ids (con posibles NULL) a int64, usando -1 para NULL"""
+    return pd.to_numeric(columna).fillna(-1).to_numpy(dtype=np.int64)
+
+class Referencia:
+    """
+    Tabla codificada: cada fila tiene una posición, un id y un nombre categórico.
+    Las claves foráneas se traducen a posiciones con codificar().
+    """
+
+    def __init__(self, ids, nombres):
+        orden = np.argsort(ids, kind="stable")
+        self.ids = ids[orden]
+        self.nombres = pd.Categorical(np.asarray(nombres, dtype=object)[orden])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def codificar(self, ids):
+        """Traduce ids a posiciones; -1 si el id es NULL o no existe en la tabla"""
+        posiciones = np.searchsorted(self.ids, ids)
+        posiciones = np.minimum(posiciones, max(len(self.ids) - 1, 0))
+        encontrados = (ids >= 0) & (len(self.ids) > 0)
+        if len(self.ids):
+            encontrados &= self.ids[posiciones] == ids
+        return np.where(encontrados, posiciones, -1).astype(np.int32)
+
+    def conteo_por_nombre(self, posiciones):
+        """
+        Cuenta las apariciones de cada posición y las agrupa por nombre,
+        igual que un JOIN + GROUP BY nombre. Devuelve una Serie ordenada de mayor a menor.
+        """
+        validas = posiciones[posiciones >= 0]
+        return self.agrupar_por_nombre(np.bincount(validas, minlength=len(self)))
+
+    def agrupar_por_nombre(self, por_posicion):
+        """Agrupa por nombre conteos que ya están calculados por posición (uno por fila de la tabla)"""
+        codigos = self.nombres.codes
+        con_nombre = codigos >= 0
+        por_nombre = np.bincount(codigos[con_nombre], weights=por_posicion[con_nombre],
+                                 minlength=len(self.nombres.categories)).astype(np.int64)
+        serie = pd.Series(por_nombre, index=self.nombres.categories)
+        serie = serie[serie > 0]
+        return serie.sort_values(ascending=False, kind="stable")
+
+    def memoria(self):
+        """Memoria ocupada en bytes"""
+        return int(self.ids.nbytes + self.nombres.memory_usage(deep=True))
+
+class SnapshotAnalitico:
+    """Copia en memoria de superhero, hero_power, hero_attribute y las tablas de referencia"""
+
+    def __init__(self, version, referencias, heroes, codigos_heroes, hero_power, hero_attribute, segundos_carga,
+                 nombres_completos=None):
+        self.version = version
+        self.referencias = referencias
+        self.heroes = heroes
+        # full_name de cada héroe, en el mismo orden que heroes (lo usa el índice de búsqueda)
+        self.nombres_completos = nombres_completos
+        self.codigos_heroes = codigos_heroes
+        self.hero_power = hero_power
+        self.hero_attribute = hero_attribute
+        self.segundos_carga = segundos_carga
+        self.cargado_en = time.time()
+
+    @classmethod
+    def cargar(cls, version):
+        """Lee las tablas de la base de datos y las codifica"""
+        inicio = time.perf_counter()
+        engine = get_engine()
+        with medir("db"), engine.connect() as conn:
+            referencias = {}
+            for tabla, columna in TABLAS_REFERENCIA.items():
+                df = pd.read_sql(f"SELECT id, {columna} FROM {tabla}", conn)
+                referencias[tabla] = Referencia(_ids_enteros(df["id"]), df[columna])
+
+            columnas = ", ".join(REFERENCIAS_SUPERHERO)
+            df_heroes = pd.read_sql(f"SELECT id, superhero_name, full_name, {columnas} FROM superhero", conn)
+            df_hero_power = pd.read_sql("SELECT hero_id, power_id FROM hero_power", conn)
+            df_hero_attribute = pd.read_sql("SELECT hero_id, attribute_id FROM hero_attribute", conn)
+
+        heroes = Referencia(_ids_enteros(df_heroes["id"]), df_heroes["superhero_name"])
+        # Reordenamos las columnas de superhero igual que Referencia ordena los ids
+        orden = np.argsort(_ids_enteros(df_heroes["id"]), kind="stable")
+        codigos_heroes = {
+            columna: referencias[tabla].codificar(_ids_enteros(df_heroes[columna])[orden])
+            for columna, tabla in REFERENCIAS_SUPERHERO.items()
+        }
+
+        hero_power = {
+            "hero_id": _ids_enteros(df_hero_power["hero_id"]),
+            "power_id": _ids_enteros(df_hero_power["power_id"]),
+        }
+        hero_power["heroe"] = heroes.codificar(hero_power["hero_id"])
+        hero_power["poder"] = referencias["superpower"].codificar(hero_power["power_id"])
+
+        hero_attribute = {
+            "hero_id": _ids_enteros(df_hero_attribute["hero_id"]),
+            "attribute_id": _ids_enteros(df_hero_attribute["attribute_id"]),
+        }
+        hero_attribute["heroe"] = heroes.codificar(hero_attribute["hero_id"])
+        hero_attribute["atributo"] = referencias["attribute"].codificar(hero_attribute["attribute_id"])
+
+        nombres_completos = pd.Categorical(df_heroes["full_name"].to_numpy(dtype=object)[orden])
+        return cls(version, referencias, heroes, codigos_heroes, hero_power, hero_attribute,
+                   round(time.perf_counter() - inicio, 3), nombres_completos)
+
+    def memoria(self):
+        """Memoria ocupada por el snapshot, en bytes, desglosada por tabla"""
+        desglose = {tabla: ref.memoria() for tabla, ref in self.referencias.items()}
+        desglose["superhero"] = self.heroes.memoria() + sum(c.nbytes for c in self.codigos_heroes.values())
+        if self.nombres_completos is not None:
+            desglose["superhero"] += int(self.nombres_completos.memory_usage(deep=True))
+        desglose["hero_power"] = sum(c.nbytes for c in self.hero_power.values())
+        desglose["hero_attribute"] = sum(c.nbytes for c in self.hero_attribute.values())
+        return desglose
+
+    def info(self):
+        """Resumen del snapshot: versión, filas, tiempo de carga y memoria"""
+        desglose = self.memoria()
+        return {
+            "version": self.version,
+            "cargado_en": self.cargado_en,
+            "segundos_carga": self.segundos_carga,
+            "filas": {
+                "superhero": len(self.heroes),
+                "hero_power": len(self.hero_power["hero_id"]),
+                "hero_attribute": len(self.hero_attribute["hero_id"]),
+                **{tabla: len(ref) for tabla, ref in self.referencias.items()},
+            },
+            "memoria_bytes": sum(desglose.values()),
+            "memoria_por_tabla": desglose,
+        }
+
+_snapshot = None
+_version = 0
+_lock_snapshot = threading.Lock()
+
+def get_snapshot():
+    """Devuelve el snapshot actual, cargándolo si todavía no existe o fue invalidado"""
+    snapshot = _snapshot
+    if snapshot is None:
+        with _lock_snapshot:
+            if _snapshot is None:
+                _cargar()
+            snapshot = _snapshot
+    return snapshot
+
+def snapshot_actual():
+    """Snapshot actual sin forzar su carga (None si todavía no se cargó)"""
+    return _snapshot
+
+def _cargar():
+    global _snapshot, _version
+    _version += 1
+    _snapshot = SnapshotAnalitico.cargar(_version)
+    print(f"✅ Snapshot analítico v{_version} cargado en {_snapshot.segundos_carga} s")
+
+def refrescar_snapshot():
+    """Vuelve a leer los datos de la base de datos y reemplaza el snapshot"""
+    with _lock_snapshot:
+        _cargar()
+        marcar_datos_modificados()
+        return _snapshot
+
+def invalidar_snapshot():
+    """Descarta el snapshot; se volverá a cargar en el siguiente uso"""
+    global _snapshot
+    with _lock_snapshot:
+        _snapshot = None
+    marcar_datos_modificados()
+
+def info_snapshot():
+    """Estado del snapshot sin forzar su carga"""
+    snapshot = _snapshot
+    if snapshot is None:
+        return {"cargado": False}
+    return {"cargado": True, **snapshot.info()}